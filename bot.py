@@ -103,9 +103,34 @@ async def change_status():
     )
 
 
+def add_commands(client: MyClient):
+    # Defined here rather than at module level, spawned inference worker
+    # processes import this module without running it
+    @client.command()
+    async def ping(ctx):
+        await ctx.send("Pong!")
+
+    @client.tree.command()
+    @discord.app_commands.check(
+        lambda i: i.user.id == 183242057882664961
+    )  # Replace with your user ID
+    async def reload(
+        interaction: discord.Interaction,
+        extension: Literal["all", "help", "schedule", "squads", "tests"] = "all",
+    ):
+        if extension == "all":
+            for filename in os.listdir("./extensions"):
+                if filename.endswith(".py"):
+                    await client.reload_extension(f"extensions.{filename[:-3]}")
+            await interaction.response.send_message("All extensions reloaded.")
+        else:
+            await client.reload_extension(f"extensions.{extension}")
+
+
 if __name__ == "__main__":
     intents = discord.Intents.all()
     client = MyClient(intents=intents)
+    add_commands(client)
 
     # observer = Observer()
     # observer.schedule(CogReloader(client), "./extensions", recursive=False)
@@ -117,25 +142,3 @@ if __name__ == "__main__":
     # finally:
     #     observer.stop()
     #     observer.join()
-
-
-@client.command()
-async def ping(ctx):
-    await ctx.send("Pong!")
-
-
-@client.tree.command()
-@discord.app_commands.check(
-    lambda i: i.user.id == 183242057882664961
-)  # Replace with your user ID
-async def reload(
-    interaction: discord.Interaction,
-    extension: Literal["all", "help", "schedule", "squads", "tests"] = "all",
-):
-    if extension == "all":
-        for filename in os.listdir("./extensions"):
-            if filename.endswith(".py"):
-                await client.reload_extension(f"extensions.{filename[:-3]}")
-        await interaction.response.send_message("All extensions reloaded.")
-    else:
-        await client.reload_extension(f"extensions.{extension}")
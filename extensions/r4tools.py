@@ -1,153 +1,422 @@
 import asyncio
-import hashlib
 import json
-import requests
+import re
 from datetime import datetime, timezone
 
 import discord
 from discord import app_commands
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord.app_commands import locale_str
 
-from utils.gift_codes import CaptchaSolver, GiftCodeRedeemer, load_model
+from utils.captcha import CaptchaBatcher, CaptchaResultCache, captcha_models
+from utils.inference import InferenceExecutor
+from orms.redemptions import RedemptionJob, create_tables as create_redemption_tables
+from utils.gift_codes import GiftCodeRedeemer
+from utils.jobs import JobManager, JobStatus
+from utils.ledger import Ledger
+from utils.metrics import RedemptionMetrics
+from utils.progress import ProgressReporter
+from utils.redemption import RedeemOutcome, RedemptionEngine, RedemptionReport
+from utils.roster import import_players, parse_roster, select_players, tag_counts
+from utils.solver_service import RemoteCaptchaSolver
+from utils.wos_api import StoveInfoCache, WOSClient
 from utils.whitecord import Embed, View, Button
 
+ABORT_REASONS = {
+    RedeemOutcome.INVALID_CODE: "**Gift code doesn't exist, redeeming stopped.**",
+    RedeemOutcome.EXPIRED: "**Gift code has expired, redeeming stopped.**",
+    RedeemOutcome.USAGE_LIMIT: (
+        "**Gift code reached its usage limit, redeeming stopped.**"
+    ),
+}
+
+
+def is_bot_owner(interaction: discord.Interaction) -> bool:
+    cog = interaction.client.get_cog("R4Tools")
+    return cog is not None and interaction.user.id == cog.config.get("owner")
+
 
 class R4Tools(commands.Cog):
     def __init__(self, client: commands.Bot):
         self.client = client
         self.translator = self.client.tree.translator
 
-    @app_commands.command()
-    async def mass_redeem(
-        self, interaction: discord.Interaction, code: str, ids_range: str = "0-100"
-    ):
-        with open("data/ids.json") as f:
-            ids = json.load(f)
-        # Redeem the code for each ID
-        onnx, metadata = load_model()
-        self.start = int(ids_range.split("-")[0])
-        self.end = int(ids_range.split("-")[1])
+        with open("config.json", "r") as f:
+            self.config = json.load(f)
+        captcha_models.configure(**self.config.get("captcha_model", {}))
 
-        player_num = self.end - self.start - 1
+        stove_cache_config = dict(self.config.get("stove_cache", {}))
+        self.stove_cache = (
+            StoveInfoCache(**stove_cache_config)
+            if stove_cache_config.pop("enabled", True)
+            else None
+        )
+        self.wos_client = WOSClient(
+            stove_cache=self.stove_cache, **self.config.get("wos_api", {})
+        )
+        self.captcha_cache = CaptchaResultCache(
+            self.config.get("captcha_cache_size", 10000)
+        )
+        self.inference = InferenceExecutor(**self.config.get("inference", {}))
+        service_config = self.config.get("captcha_service", {})
+        # Shared solver service of all bot instances, instead of a local model
+        self.remote_solver = (
+            RemoteCaptchaSolver(
+                url=f"http://{service_config.get('host', '127.0.0.1')}:"
+                f"{service_config.get('port', 8765)}",
+                socket_path=service_config.get("socket_path"),
+                timeout=service_config.get("timeout", 10.0),
+            )
+            if service_config.get("enabled", False)
+            else None
+        )
+        self.engine: RedemptionEngine | None = None
+        self._engine_lock = asyncio.Lock()
+        self.metrics = RedemptionMetrics()
+        self.metrics_config = self.config.get("metrics", {})
 
-        async def cancel_callback(button_interaction: discord.Interaction):
-            await button_interaction.delete_original_response()
-            return
+        self.jobs = JobManager(
+            self.get_engine,
+            on_start=self.on_job_start,
+            on_progress=self.on_job_progress,
+            on_finish=self.on_job_finish,
+            **self.config.get("jobs", {}),
+        )
+        # Progress reporters of jobs started from an interaction in this session
+        self.reporters: dict[int, ProgressReporter] = {}
 
-        async def approve_callback(button_interaction: discord.Interaction):
-            await interaction.delete_original_response()
-            fail = []
+    async def cog_load(self):
+        create_redemption_tables()
+        if self.stove_cache is not None and self.stove_cache.persist:
+            await asyncio.to_thread(self.stove_cache.load)
+        if self.remote_solver is None:
+            # Load and warm up the captcha model in the background, off the event loop
+            self.model_warmup = asyncio.create_task(self.inference.warmup())
+        self.jobs.resume()
+        if self.metrics_config.get("textfile"):
+            self.export_metrics.change_interval(
+                seconds=self.metrics_config.get("interval", 15)
+            )
+            self.export_metrics.start()
 
-            async def retry_callback(retry_button_interaction: discord.Interaction):
-                await retry_button_interaction.response.defer()
-                msg = await button_interaction.original_response()
-                await msg.edit(
-                    embed=Embed(
-                        translator=self.translator,
-                        locale=interaction.locale,
-                        title="Mass Redeem - Retrying",
-                        description=f"""
-                        Code: `{code}`
-                        Included accounts: {len(fail)}
-                        ━━━━━━━━━━━━━━━━━━━━━━
-                        ✅ 0 / {len(fail)} Success
-                        ❗ 0 / {len(fail)} Already Redeemed
-                        ❌ 0 / {len(fail)} Fail
-                        ━━━━━━━━━━━━━━━━━━━━━━
-                        """,
-                    )
-                )
+    async def cog_unload(self):
+        self.export_metrics.cancel()
+        await self.jobs.shutdown()
+        await self.wos_client.close()
+        self.inference.shutdown()
+        if self.remote_solver is not None:
+            await self.remote_solver.close()
 
-                retry_success, retry_already_redeemed, retry_fail = (
-                    await self.perform_mass_redeem(
-                        button_interaction,
-                        fail,
-                        onnx,
-                        metadata,
-                        code,
-                        self.start,
-                        self.end,
-                        True,
-                    )
+    async def get_engine(self) -> RedemptionEngine:
+        # One engine per bot, so concurrent runs share its rate limits. Jobs
+        # starting together wait for the first one to build it.
+        async with self._engine_lock:
+            if self.engine is None:
+                if self.remote_solver is not None:
+                    solver = self.remote_solver
+                else:
+                    await self.inference.warmup()
+                    solver = CaptchaBatcher(self.inference)
+                redeemer = GiftCodeRedeemer(self.wos_client, solver)
+                self.engine = RedemptionEngine(
+                    redeemer,
+                    ledger=Ledger(),
+                    captcha_cache=self.captcha_cache,
+                    metrics=self.metrics,
+                    **self.config.get("redemption", {}),
                 )
+        return self.engine
 
-                msg = await button_interaction.original_response()
-                await msg.edit(
-                    embed=Embed(
-                        translator=self.translator,
-                        locale=interaction.locale,
-                        title="Mass Redeem - Retrying",
-                        description=f"""
-                        Code: `{code}`
-                        Included accounts: {len(fail)}
-                        ━━━━━━━━━━━━━━━━━━━━━━
-                        ✅ {len(retry_success)} / {len(fail)} Success
-                        ❗ {len(retry_already_redeemed)} / {len(fail)} Already Redeemed
-                        ❌ {len(retry_fail)} / {len(fail)} Fail
-                        ━━━━━━━━━━━━━━━━━━━━━━
-                        """,
-                    )
-                )
+    @tasks.loop(seconds=15)
+    async def export_metrics(self):
+        # Rendered here, the engine updates the metrics on this thread
+        text = self.metrics.render()
+        try:
+            await asyncio.to_thread(
+                self.metrics.write_textfile, self.metrics_config["textfile"], text
+            )
+        except OSError as e:
+            print(f"Failed to write metrics: {e}")
 
-            await button_interaction.response.send_message(
-                embed=Embed(
-                    translator=self.translator,
-                    locale=interaction.locale,
-                    title="Mass Redeem - Starting",
-                    description=f"""
-                    Code: `{code}`
-                    Included accounts: {player_num}
-                    ━━━━━━━━━━━━━━━━━━━━━━
-                    ✅ 0 / {player_num} Success
-                    ❗ 0 / {player_num} Already Redeemed
-                    ❌ 0 / {player_num} Fail
-                    ━━━━━━━━━━━━━━━━━━━━━━
-                    """,
-                    color=0x00FF00,
-                    timestamp=datetime.now(timezone.utc),
-                ),
+    def stove_cache_summary(self) -> str:
+        if self.stove_cache is None:
+            return ""
+        return (
+            f"🗄️ Stove info cache: {self.stove_cache.hits} hits / "
+            f"{self.stove_cache.misses} misses ({self.stove_cache.hit_ratio:.0%})"
+        )
+
+    def captcha_cache_summary(self) -> str:
+        return (
+            f"🧩 Captcha cache: {self.captcha_cache.hits} hits / "
+            f"{self.captcha_cache.misses} misses ({self.captcha_cache.hit_ratio:.0%})"
+        )
+
+    @staticmethod
+    def format_eta(seconds: float) -> str:
+        minutes, seconds = divmod(int(seconds), 60)
+        return f"{minutes}m {seconds:02d}s" if minutes else f"{seconds}s"
+
+    def progress_reporter(self, **kwargs) -> ProgressReporter:
+        return ProgressReporter(**kwargs, **self.config.get("progress", {}))
+
+    def job_reporter(self, job: RedemptionJob) -> ProgressReporter:
+        if job.id not in self.reporters:
+            # Resumed jobs have no interaction to answer, post in their channel
+            self.reporters[job.id] = self.progress_reporter(
+                channel=self.client.get_channel(job.channel_id)
+            )
+        return self.reporters[job.id]
+
+    @staticmethod
+    def code_table(
+        report: RedemptionReport, player_num: int, finished: bool = False
+    ) -> str:
+        lines = [
+            f"Code: `{report.code}`",
+            f"✅ {len(report.success)} / {player_num} Success",
+            f"❗ {len(report.already_redeemed)} / {player_num} Already Redeemed",
+            f"❌ {len(report.fail)} / {player_num} Fail",
+        ]
+        if finished:
+            lines.append(f"⏭️ {report.skipped} / {player_num} Known from previous runs")
+        if report.aborted:
+            lines.append(ABORT_REASONS[report.aborted])
+        return "\n".join(lines)
+
+    def code_tables(
+        self,
+        job: RedemptionJob,
+        reports: dict[str, RedemptionReport],
+        finished: bool = False,
+    ) -> str:
+        """One result table per code, codes without results yet just listed."""
+        player_num = len(json.loads(job.player_ids))
+        return "\n━━━━━━━━━━━━━━━━━━━━━━\n".join(
+            (
+                self.code_table(reports[code], player_num, finished)
+                if code in reports
+                else f"Code: `{code}`\n⏳ Waiting for the first result"
+            )
+            for code in job.gift_codes
+        )
+
+    def job_embed(
+        self, job: RedemptionJob, reports: dict[str, RedemptionReport] | None
+    ):
+        player_num = len(json.loads(job.player_ids))
+        codes = ", ".join(f"`{code}`" for code in job.gift_codes)
+        title = "Mass Redeem - Retrying" if job.parent_id else "Mass Redeem"
+        if not reports:
+            position = self.jobs.queue_position(job)
+            return Embed(
+                translator=self.translator,
+                locale=job.locale,
+                title=f"{title} - Queued",
+                description=f"""
+                Job: `#{job.id}`
+                Codes: {codes}
+                Included accounts: {player_num}
+                {f'Position in queue: {position}' if position else 'Starting...'}
+                """,
+                color=0x00FF00,
+                timestamp=datetime.now(timezone.utc),
             )
 
-            success, already_redeemed, fail = await self.perform_mass_redeem(
-                button_interaction, ids, onnx, metadata, code, self.start, self.end
+        flow = self.engine.flow_stats(job.guild_id) if self.engine else None
+        open_circuits = self.engine.open_circuits if self.engine else []
+        paused = ", ".join(breaker.name for breaker in open_circuits)
+        # Stages are shared by all codes of the run
+        stage_summary = next(iter(reports.values())).stage_summary
+        return Embed(
+            translator=self.translator,
+            locale=job.locale,
+            title=f"{title} - Executing...",
+            description=f"""
+            Job: `#{job.id}`
+            Included accounts: {player_num}
+            {f'⏳ About {self.format_eta(flow["eta"])} left' if flow else ''}
+            {f'⏸️ Paused, WOS {paused} endpoint down' if paused else ''}
+            ━━━━━━━━━━━━━━━━━━━━━━
+            {self.code_tables(job, reports)}
+            ━━━━━━━━━━━━━━━━━━━━━━
+            ```{stage_summary}```
+            """,
+            color=0x00FF00,
+            timestamp=datetime.now(timezone.utc),
+        )
+
+    def job_finished_embed(
+        self, job: RedemptionJob, reports: dict[str, RedemptionReport] | None
+    ) -> Embed:
+        player_num = len(json.loads(job.player_ids))
+        codes = ", ".join(f"`{code}`" for code in job.gift_codes)
+        title = "Mass Redeem - Retrying" if job.parent_id else "Mass Redeem"
+
+        if not reports:
+            return Embed(
+                translator=self.translator,
+                locale=job.locale,
+                title=f"{title} - {job.status.capitalize()}",
+                description=f"""
+                Job: `#{job.id}`
+                Codes: {codes}
+                Included accounts: {player_num}
+                """,
+                color=0xFF0000,
+                timestamp=datetime.now(timezone.utc),
             )
 
-            msg = await button_interaction.original_response()
+        if job.status == JobStatus.CANCELLED.value:
+            summary = "**Redeeming was cancelled.**"
+        elif any(report.fail for report in reports.values()):
+            summary = (
+                "**Failed multiple times, please try again later for successful "
+                "redeem.**"
+            )
+        elif all(report.aborted for report in reports.values()):
+            summary = ""
+        else:
+            summary = "**All accounts have been successfully redeemed!**"
 
-            if fail:
-                retry_view = View(
-                    translator=self.translator,
-                    locale=interaction.locale,
+        retries = sum(report.retries for report in reports.values())
+        rounds = max(report.rounds for report in reports.values())
+        refetches = sum(report.captcha_refetches for report in reports.values())
+        done = sum(report.done - report.skipped for report in reports.values())
+        elapsed = max(report.elapsed for report in reports.values())
+        stage_summary = next(iter(reports.values())).stage_summary
+        return Embed(
+            translator=self.translator,
+            locale=job.locale,
+            title=f"{title} - {job.status.capitalize()}",
+            description=f"""
+            Job: `#{job.id}`
+            Included accounts: {player_num}
+            ━━━━━━━━━━━━━━━━━━━━━━
+            {self.code_tables(job, reports, finished=True)}
+            ━━━━━━━━━━━━━━━━━━━━━━
+            🔁 {retries} automatic retries over {rounds} rounds
+            🎯 {refetches} low-confidence captchas re-fetched
+            ⏱️ {done / elapsed * 60 if elapsed else 0.0:.1f} redemptions/min
+            {self.stove_cache_summary()}
+            {self.captcha_cache_summary()}
+            ```{stage_summary}```
+            {summary}
+            """,
+            color=0x00FF00 if job.status == JobStatus.FINISHED.value else 0xFF0000,
+            timestamp=datetime.now(timezone.utc),
+        )
+
+    async def on_job_start(self, job: RedemptionJob):
+        # Resumed jobs start during setup, their channel isn't available before that
+        await self.client.wait_until_ready()
+
+    def on_job_progress(self, job: RedemptionJob, reports: dict[str, RedemptionReport]):
+        # Rendered lazily, only when the reporter actually edits the message
+        self.job_reporter(job).update(lambda: self.job_embed(job, reports))
+
+    async def on_job_finish(
+        self, job: RedemptionJob, reports: dict[str, RedemptionReport] | None
+    ):
+        await self.client.wait_until_ready()
+        reporter = self.job_reporter(job)
+        self.reporters.pop(job.id, None)
+
+        retry_view = None
+        failed_codes = [code for code, report in (reports or {}).items() if report.fail]
+        if failed_codes and job.status == JobStatus.FINISHED.value:
+            # The ledger skips the codes a player already got in the retry
+            failed_ids = sorted(
+                {player_id for code in failed_codes for player_id in reports[code].fail}
+            )
+
+            async def retry_callback(retry_button_interaction: discord.Interaction):
+                retry_job = self.jobs.enqueue(
+                    guild_id=job.guild_id,
+                    channel_id=job.channel_id,
+                    user_id=retry_button_interaction.user.id,
+                    gift_codes=failed_codes,
+                    player_ids=failed_ids,
+                    locale=str(retry_button_interaction.locale),
+                    parent_id=job.id,
                 )
-                retry_view.add_item(
-                    Button(
-                        label="Retry",
-                        style=discord.ButtonStyle.green,
-                        custom_id="retry_mass_redeem",
-                        callback=retry_callback,
-                    )
+                # The retry has its own interaction token, keep reporting through it
+                self.reporters[retry_job.id] = self.progress_reporter(
+                    interaction=retry_button_interaction
+                )
+                await retry_button_interaction.response.edit_message(
+                    embed=self.job_embed(retry_job, None), view=None
                 )
 
-            await msg.edit(
-                embed=Embed(
-                    translator=self.translator,
-                    locale=interaction.locale,
-                    title="Mass Redeem - Finished",
-                    description=f"""
-                    Code: `{code}`
-                    Included accounts: {player_num}
-                    ━━━━━━━━━━━━━━━━━━━━━━
-                    ✅ {len(success)} / {player_num} Success
-                    ❗ {len(already_redeemed)} / {player_num} Already Redeemed
-                    ❌ {len(fail)} / {player_num} Fail
-                    ━━━━━━━━━━━━━━━━━━━━━━
-                    { '**Failed multiple times, please try again later for successful redeem.**' if fail else '**All accounts have been successfully redeemed!**' }
-                    """,
-                    color=0x00FF00,
-                    timestamp=datetime.now(timezone.utc),
-                ),
-                view=retry_view if fail else None,
+            retry_view = View(
+                translator=self.translator,
+                locale=job.locale,
+            )
+            retry_view.add_item(
+                Button(
+                    label="Retry",
+                    style=discord.ButtonStyle.green,
+                    custom_id="retry_mass_redeem",
+                    callback=retry_callback,
+                )
+            )
+
+        await reporter.finish(
+            embed=self.job_finished_embed(job, reports), view=retry_view
+        )
+
+    @app_commands.command()
+    @app_commands.describe(
+        code="One or more gift codes, separated by spaces",
+        tag="Only players with this roster tag, e.g. r4",
+        limit="At most this many players",
+    )
+    async def mass_redeem(
+        self,
+        interaction: discord.Interaction,
+        code: str,
+        tag: str | None = None,
+        limit: int | None = None,
+    ):
+        # Several codes run as one job, each player logs in once for all
+        codes = list(dict.fromkeys(re.split(r"[\s,]+", code.strip())))
+        codes = [gift_code for gift_code in codes if gift_code]
+        if not codes:
+            await interaction.response.send_message(
+                "Give at least one gift code.", ephemeral=True
+            )
+            return
+        ids = select_players(
+            guild_id=interaction.guild_id, tags=[tag] if tag else None, limit=limit
+        )
+        if not ids:
+            await interaction.response.send_message(
+                "No active roster players match, add some with `/roster import`.",
+                ephemeral=True,
+            )
+            return
+
+        player_num = len(ids)
+
+        async def cancel_callback(button_interaction: discord.Interaction):
+            await button_interaction.delete_original_response()
+            return
+
+        async def approve_callback(button_interaction: discord.Interaction):
+            await interaction.delete_original_response()
+            job = self.jobs.enqueue(
+                guild_id=interaction.guild_id or 0,
+                channel_id=interaction.channel_id,
+                user_id=interaction.user.id,
+                gift_codes=codes,
+                player_ids=ids,
+                locale=str(interaction.locale),
+            )
+            self.reporters[job.id] = self.progress_reporter(
+                interaction=button_interaction
+            )
+            await button_interaction.response.send_message(
+                embed=self.job_embed(job, None)
             )
 
         start_view = View(
@@ -177,7 +446,8 @@ class R4Tools(commands.Cog):
                 locale=interaction.locale,
                 title="Mass Redeem - Starting",
                 description=f"""
-                Code: `{code}`
+                Codes: {", ".join(f"`{gift_code}`" for gift_code in codes)}
+                {f'Tag: `{tag}`' if tag else 'Whole roster'}
                 Included accounts: {player_num}
                 Start Mass Redeem?
                 """,
@@ -187,74 +457,152 @@ class R4Tools(commands.Cog):
             view=start_view,
         )
 
-    async def perform_mass_redeem(
-        self, interaction, ids, onnx, metadata, code, start, end, retry=False
-    ):
-        success = []
-        already_redeemed = []
-        fail = []
-
-        player_num = end - start
-
-        for player_id in ids[start:end]:
-            gift_code_redeemer = GiftCodeRedeemer(
-                player_id=player_id,
-                giftcode=code,
-                onnx_session=onnx,
-                onnx_metadata=metadata,
-            )
-            err_code, msg = gift_code_redeemer.redeem_gift_code()
+    redeem_jobs_group = app_commands.Group(
+        name="redeem_jobs", description="Manage mass redeem jobs"
+    )
+    redeem_jobs_group.default_permissions = discord.Permissions(manage_guild=True)
 
-            if err_code == 20000:
-                success.append(player_id)
-            elif err_code == 40008:
-                already_redeemed.append(player_id)
-            else:
-                fail.append(player_id)
-
-            interaction_message = await interaction.original_response()
-            if not retry:
-                await interaction_message.edit(
-                    embed=Embed(
-                        translator=self.translator,
-                        locale=interaction.locale,
-                        title="Mass Redeem - Executing...",
-                        description=f"""
-                        Code: `{code}`
-                        Included accounts: {player_num}
-                        ━━━━━━━━━━━━━━━━━━━━━━
-                        ✅ {len(success)} / {player_num} Success
-                        ❗ {len(already_redeemed)} / {player_num} Already Redeemed
-                        ❌ {len(fail)} / {player_num} Fail
-                        ━━━━━━━━━━━━━━━━━━━━━━
-                        """,
-                        color=0x00FF00,
-                        timestamp=datetime.now(timezone.utc),
-                    )
-                )
+    @redeem_jobs_group.command(name="status", description="Show active redeem jobs")
+    async def redeem_jobs_status(self, interaction: discord.Interaction):
+        jobs = self.jobs.active(interaction.guild_id or 0)
+        lines = []
+        for job in jobs:
+            player_num = len(json.loads(job.player_ids))
+            reports = self.jobs.reports.get(job.id)
+            if reports:
+                done = sum(report.done for report in reports.values())
+                total = player_num * len(job.gift_codes)
+                state = f"running, {done} / {total} done"
+            elif job.status == JobStatus.RUNNING.value:
+                state = "starting"
             else:
-                await interaction_message.edit(
-                    embed=Embed(
-                        translator=self.translator,
-                        locale=interaction.locale,
-                        title="Mass Redeem - Retrying...",
-                        description=f"""
-                        Code: `{code}`
-                        Included accounts: {len(ids)}
-                        ━━━━━━━━━━━━━━━━━━━━━━
-                        ✅ {len(success)} / {len(ids)} Success
-                        ❗ {len(already_redeemed)} / {len(ids)} Already Redeemed
-                        ❌ {len(fail)} / {len(ids)} Fail
-                        ━━━━━━━━━━━━━━━━━━━━━━
-                        """,
-                        color=0x00FF00,
-                        timestamp=datetime.now(timezone.utc),
-                    )
-                )
-            # Wait a few seconds before continuing to the next iteration
-            await asyncio.sleep(2)
+                state = f"queued, position {self.jobs.queue_position(job)}"
+            lines.append(
+                f"`#{job.id}` "
+                + ", ".join(f"`{gift_code}`" for gift_code in job.gift_codes)
+                + f" - {player_num} accounts, {state}"
+            )
+        if self.engine is not None and any(job.id in self.jobs.reports for job in jobs):
+            flow = self.engine.flow_stats(interaction.guild_id or 0)
+            lines.append(
+                f"\n📥 {flow['queued_requests']} requests queued, "
+                f"{flow['share']:.0%} of the API rate, "
+                f"about {self.format_eta(flow['eta'])} left"
+            )
+
+        await interaction.response.send_message(
+            embed=Embed(
+                translator=self.translator,
+                locale=interaction.locale,
+                title="Mass Redeem - Jobs",
+                description="\n".join(lines) if lines else "No active jobs.",
+                color=0x00FF00,
+                timestamp=datetime.now(timezone.utc),
+            ),
+            ephemeral=True,
+        )
 
-        return success, already_redeemed, fail
+    @redeem_jobs_group.command(name="cancel", description="Cancel a redeem job")
+    async def redeem_jobs_cancel(self, interaction: discord.Interaction, job_id: int):
+        await interaction.response.defer(ephemeral=True)
+        cancelled = await self.jobs.cancel(job_id, interaction.guild_id or 0)
+        await interaction.followup.send(
+            (
+                f"Job `#{job_id}` cancelled."
+                if cancelled
+                else f"Job `#{job_id}` isn't queued or running."
+            ),
+            ephemeral=True,
+        )
+
+    @app_commands.command(description="Show redemption timings and counters")
+    @app_commands.check(is_bot_owner)
+    async def redeem_metrics(self, interaction: discord.Interaction):
+        summary = self.metrics.summary()
+        stage_lines = "\n".join(
+            f"{stage:>13}: p50 {stats['p50'] * 1000:6.0f} ms  "
+            f"p95 {stats['p95'] * 1000:6.0f} ms  "
+            f"p99 {stats['p99'] * 1000:6.0f} ms  ({stats['count']})"
+            for stage, stats in summary["stages"].items()
+        )
+        counter_lines = "\n".join(
+            f"{name}: "
+            + ", ".join(f"{labels} {int(count)}" for labels, count in values.items())
+            for name, values in summary["counters"].items()
+        )
+        await interaction.response.send_message(
+            embed=Embed(
+                translator=self.translator,
+                locale=interaction.locale,
+                title="Mass Redeem - Metrics",
+                description=f"""
+                ```{stage_lines or 'No stage timings yet.'}```
+                ━━━━━━━━━━━━━━━━━━━━━━
+                ```{counter_lines or 'No counters yet.'}```
+                {self.stove_cache_summary()}
+                {self.captcha_cache_summary()}
+                """,
+                color=0x00FF00,
+                timestamp=datetime.now(timezone.utc),
+            ),
+            ephemeral=True,
+        )
+
+    roster_group = app_commands.Group(
+        name="roster", description="Manage the mass redeem roster"
+    )
+    roster_group.default_permissions = discord.Permissions(manage_guild=True)
+
+    @roster_group.command(
+        name="import", description="Add or update players from a JSON/JSONC/CSV file"
+    )
+    @app_commands.describe(
+        file="List of IDs, or objects/rows with fid, name, tags and active",
+        replace_tags="Replace the tags of imported players instead of adding to them",
+    )
+    async def roster_import(
+        self,
+        interaction: discord.Interaction,
+        file: discord.Attachment,
+        replace_tags: bool = False,
+    ):
+        await interaction.response.defer(ephemeral=True)
+        try:
+            players = parse_roster(
+                (await file.read()).decode("utf-8"), file.filename.rsplit(".", 1)[-1]
+            )
+            added, updated = await asyncio.to_thread(
+                import_players, players, interaction.guild_id, replace_tags
+            )
+        except (ValueError, KeyError) as e:
+            await interaction.followup.send(
+                f"Couldn't read `{file.filename}`: {e}", ephemeral=True
+            )
+            return
+        await interaction.followup.send(
+            f"Roster updated: {added} added, {updated} updated.", ephemeral=True
+        )
+
+    @roster_group.command(name="summary", description="Show roster size per tag")
+    async def roster_summary(self, interaction: discord.Interaction):
+        total = len(select_players(guild_id=interaction.guild_id))
+        counts = tag_counts(interaction.guild_id)
+        tag_lines = "\n".join(f"`{tag}`: {count}" for tag, count in counts.items())
+        await interaction.response.send_message(
+            embed=Embed(
+                translator=self.translator,
+                locale=interaction.locale,
+                title="Roster",
+                description=f"""
+                Active players: {total}
+                ━━━━━━━━━━━━━━━━━━━━━━
+                {tag_lines or 'No tags yet.'}
+                """,
+                color=0x00FF00,
+                timestamp=datetime.now(timezone.utc),
+            ),
+            ephemeral=True,
+        )
 
 
 async def setup(client: commands.Bot):
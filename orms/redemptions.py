@@ -0,0 +1,98 @@
+from peewee import (
+    SqliteDatabase,
+    Model,
+    IntegerField,
+    TextField,
+    CompositeKey,
+    AutoField,
+)
+
+database = SqliteDatabase(
+    "./database/redemptions.db", pragmas={"journal_mode": "wal", "synchronous": 1}
+)
+
+
+class BaseModel(Model):
+    class Meta:
+        database = database
+
+
+class RedemptionLedger(BaseModel):
+    player_id = IntegerField(null=False)
+    gift_code = TextField(null=False)
+    result = TextField(null=False)
+    err_code = IntegerField(null=True)
+    timestamp = IntegerField(null=False)
+
+    class Meta:
+        table_name = "RedemptionLedger"
+        primary_key = CompositeKey("player_id", "gift_code")
+
+
+class StoveInfo(BaseModel):
+    fid = IntegerField(null=False, primary_key=True)
+    stove_info = TextField(null=False)
+    cookies = TextField(null=False)
+    fetched_at = IntegerField(null=False)
+
+    class Meta:
+        table_name = "StoveInfo"
+
+
+class RedemptionJob(BaseModel):
+    id = AutoField()
+    guild_id = IntegerField(null=False)
+    channel_id = IntegerField(null=False)
+    user_id = IntegerField(null=False)
+    locale = TextField(null=True)
+    # Space separated when the job redeems several codes
+    gift_code = TextField(null=False)
+    player_ids = TextField(null=False)
+    parent_id = IntegerField(null=True)
+    status = TextField(null=False)
+    created_at = IntegerField(null=False)
+    started_at = IntegerField(null=True)
+    finished_at = IntegerField(null=True)
+    success = IntegerField(null=True)
+    already_redeemed = IntegerField(null=True)
+    fail = IntegerField(null=True)
+    failed_ids = TextField(null=True)
+
+    class Meta:
+        table_name = "RedemptionJob"
+
+    @property
+    def gift_codes(self) -> list[str]:
+        return self.gift_code.split()
+
+
+class RosterPlayer(BaseModel):
+    fid = IntegerField(null=False, primary_key=True)
+    guild_id = IntegerField(null=True, index=True)
+    name = TextField(null=True)
+    is_active = IntegerField(null=False, default=1, index=True)
+    last_seen = IntegerField(null=True, index=True)
+    added_at = IntegerField(null=False)
+
+    class Meta:
+        table_name = "RosterPlayer"
+
+
+class RosterTag(BaseModel):
+    fid = IntegerField(null=False)
+    tag = TextField(null=False, index=True)
+
+    class Meta:
+        table_name = "RosterTag"
+        primary_key = CompositeKey("fid", "tag")
+
+
+def create_tables():
+    database.create_tables(
+        [RedemptionLedger, StoveInfo, RedemptionJob, RosterPlayer, RosterTag],
+        safe=True,
+    )
+
+
+if __name__ == "__main__":
+    create_tables()
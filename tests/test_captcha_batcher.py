@@ -0,0 +1,24 @@
+import asyncio
+
+from utils.captcha import CaptchaBatcher, CaptchaSolution
+
+
+class SlowExecutor:
+    workers = 1
+
+    async def run_batch(self, images: list[bytes]) -> list[CaptchaSolution]:
+        await asyncio.sleep(0.05)
+        return [CaptchaSolution(image.decode(), (1.0,)) for image in images]
+
+
+def test_solve_queued_while_batch_runs():
+    async def scenario():
+        batcher = CaptchaBatcher(SlowExecutor(), max_wait=0.001)
+        first = asyncio.create_task(batcher.solve(b"AAAA"))
+        # Arrives while the first batch is in the executor
+        await asyncio.sleep(0.02)
+        second = asyncio.create_task(batcher.solve(b"BBBB"))
+        return await asyncio.wait_for(asyncio.gather(first, second), timeout=1)
+
+    results = asyncio.run(scenario())
+    assert [result.text for result in results] == ["AAAA", "BBBB"]
@@ -0,0 +1,76 @@
+"""
+Compares captcha inference throughput of the inference executor modes.
+
+Usage (from the repository root):
+    python -m tools.benchmark_inference data/captcha_corpus --workers 1 2 4
+
+Every mode and worker count solves the whole corpus (repeated `--rounds`
+times) through a `CaptchaBatcher`, with `--concurrency` solves in flight
+like a mass redemption would have. Pick the fastest row for the
+"inference" section of config.json.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from utils.captcha import CaptchaBatcher, captcha_models, load_corpus
+from utils.inference import INFERENCE_MODES, InferenceExecutor
+
+
+async def measure(executor: InferenceExecutor, images: list[bytes], concurrency: int):
+    await executor.warmup()
+    batcher = CaptchaBatcher(executor)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def solve(image_bytes: bytes):
+        async with semaphore:
+            return await batcher.solve(image_bytes)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(solve(image_bytes) for image_bytes in images))
+    elapsed = time.perf_counter() - started
+    return {
+        "images_per_second": len(images) / elapsed,
+        "elapsed": elapsed,
+        "batches": batcher.batches,
+        "mean_batch": batcher.items / batcher.batches if batcher.batches else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("corpus", help="Folder with labeled captcha images")
+    parser.add_argument("--modes", nargs="+", default=list(INFERENCE_MODES))
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 2, 4])
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument(
+        "--threads", type=int, default=1, help="intra-op threads of every session"
+    )
+    args = parser.parse_args()
+
+    with open("config.json", "r") as f:
+        captcha_models.configure(**json.load(f).get("captcha_model", {}))
+    captcha_models.configure(intra_op_threads=args.threads)
+
+    images = [image_bytes for image_bytes, _ in load_corpus(args.corpus)] * args.rounds
+    print(f"{len(images)} captchas, {os.cpu_count()} CPU cores")
+
+    for mode in args.modes:
+        for workers in [1] if mode == "inline" else args.workers:
+            executor = InferenceExecutor(mode, workers)
+            try:
+                result = asyncio.run(measure(executor, images, args.concurrency))
+            finally:
+                executor.shutdown()
+            print(
+                f"{mode:>8} x{workers:<3} {result['images_per_second']:8.1f} img/s"
+                f"  ({result['batches']} batches, mean size {result['mean_batch']:.1f})"
+            )
+
+
+if __name__ == "__main__":
+    main()
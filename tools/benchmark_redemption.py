@@ -0,0 +1,114 @@
+"""
+Measures mass redemption throughput against the local fake WOS API.
+
+Usage (from the repository root):
+    python -m tools.benchmark_redemption --accounts 100 1000 10000
+
+Runs the real `RedemptionEngine`, `WOSClient` and `GiftCodeRedeemer`
+against an in-process `FakeWOSServer`, once per account count, and prints
+accounts per second plus p50/p95/p99 latency of every pipeline stage. With
+`--solver stub` captchas are "solved" instantly, which isolates the network
+side; `--solver model` runs the captcha model through the configured
+inference executor.
+"""
+
+import argparse
+import asyncio
+import json
+
+from tools.fake_wos_api import FakeWOSServer
+from utils.captcha import CaptchaBatcher, CaptchaSolution, captcha_models
+from utils.gift_codes import GiftCodeRedeemer
+from utils.inference import InferenceExecutor
+from utils.redemption import RedemptionEngine
+from utils.wos_api import WOSClient
+
+
+class StubSolver:
+    async def solve(self, image_bytes: bytes) -> CaptchaSolution:
+        return CaptchaSolution("AAAA", (1.0, 1.0, 1.0, 1.0))
+
+
+async def run(args, config: dict):
+    server = FakeWOSServer(
+        codes={f"BENCH{n}": None for n in args.accounts},
+        latency=args.latency,
+        jitter=args.jitter,
+        rate_limit=args.rate_limit,
+        captcha_error_rate=args.captcha_error_rate,
+    )
+    api_url = await server.start()
+
+    executor = None
+    if args.solver == "model":
+        captcha_models.configure(**config.get("captcha_model", {}))
+        executor = InferenceExecutor(**config.get("inference", {}))
+        await executor.warmup()
+        solver = CaptchaBatcher(executor)
+    else:
+        solver = StubSolver()
+
+    redemption_config = {
+        **config.get("redemption", {}),
+        "rate": args.rate,
+        "burst": args.burst,
+        "max_concurrency": args.concurrency,
+        "retry_base_delay": 0.5,
+        "retry_max_delay": 2.0,
+        # Percentiles over the whole run, not just its tail
+        "latency_samples": None,
+    }
+    connections = max(args.concurrency, 32)
+
+    try:
+        for accounts in args.accounts:
+            client = WOSClient(
+                connection_limit=connections,
+                api_url=api_url,
+            )
+            engine = RedemptionEngine(
+                GiftCodeRedeemer(client, solver), **redemption_config
+            )
+            player_ids = list(range(100_000_000, 100_000_000 + accounts))
+            report = await engine.run(player_ids, f"BENCH{accounts}")
+            await client.close()
+
+            print(
+                f"\n{accounts} accounts in {report.elapsed:.1f}s: "
+                f"{report.done / report.elapsed:.1f} accounts/s, "
+                f"{len(report.success)} redeemed, {len(report.fail)} failed, "
+                f"{report.retries} retries"
+            )
+            for stage in report.stages.values():
+                print(
+                    f"  {stage.name:>14}: "
+                    f"p50 {stage.percentile(50) * 1000:7.1f} ms  "
+                    f"p95 {stage.percentile(95) * 1000:7.1f} ms  "
+                    f"p99 {stage.percentile(99) * 1000:7.1f} ms"
+                )
+    finally:
+        await server.stop()
+        if executor is not None:
+            executor.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--accounts", nargs="+", type=int, default=[100, 1000, 10000])
+    parser.add_argument("--solver", choices=("stub", "model"), default="stub")
+    parser.add_argument("--latency", type=float, default=0.05, help="server latency")
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--rate-limit", type=float, default=None, help="server req/s")
+    parser.add_argument("--captcha-error-rate", type=float, default=0.0)
+    parser.add_argument("--rate", type=float, default=200.0, help="client req/s")
+    parser.add_argument("--burst", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+
+    with open("config.json", "r") as f:
+        config = json.load(f)
+    asyncio.run(run(args, config))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Accuracy and latency benchmark of the captcha solver on a labeled corpus.
+
+Usage (from the repository root):
+    python -m tools.benchmark_solver data/captcha_corpus -o solver.json
+
+For every intra-op thread count it loads the configured model and reports
+p50/p95/p99 latency of single `CaptchaSolver.solve` calls, images per
+second at each batch size, and overall and per-position character
+accuracy. Peak RSS is included. Everything is written as JSON, so runs can
+be diffed over time (`--output`, or stdout without it).
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+
+import onnxruntime as ort
+
+from utils.captcha import (
+    CaptchaModelRegistry,
+    CaptchaPreprocessor,
+    MODELS_FOLDER,
+    infer_batch,
+    load_corpus,
+)
+from utils.gift_codes import CaptchaSolver
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb() -> float | None:
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if platform.system() == "Darwin" else 1024)
+
+
+def percentiles(samples: list[float]) -> dict:
+    ordered = sorted(samples)
+
+    def pick(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+    return {
+        "p50_ms": pick(50) * 1000,
+        "p95_ms": pick(95) * 1000,
+        "p99_ms": pick(99) * 1000,
+        "mean_ms": sum(ordered) / len(ordered) * 1000,
+    }
+
+
+def accuracy(solutions, labels: list[str], positions: int) -> dict:
+    correct = sum(solution.text == label for solution, label in zip(solutions, labels))
+    per_position = [
+        sum(
+            len(label) > pos and solution.text[pos] == label[pos]
+            for solution, label in zip(solutions, labels)
+        )
+        / len(labels)
+        * 100
+        for pos in range(positions)
+    ]
+    return {"accuracy": correct / len(labels) * 100, "per_position": per_position}
+
+
+def throughput(onnx_session, metadata, resample, images, batch_size, min_images):
+    preprocessor = CaptchaPreprocessor(metadata, resample, batch_size)
+    # Repeat the corpus so small corpora still give stable numbers
+    stream = (images * (min_images // len(images) + 1))[: max(min_images, batch_size)]
+    started = time.perf_counter()
+    for start in range(0, len(stream), batch_size):
+        batch = stream[start : start + batch_size]
+        infer_batch(onnx_session, metadata, preprocessor, batch)
+    return len(stream) / (time.perf_counter() - started)
+
+
+def default_threads() -> list[int]:
+    cores = os.cpu_count() or 1
+    threads = [1]
+    while threads[-1] * 2 <= cores:
+        threads.append(threads[-1] * 2)
+    if threads[-1] != cores:
+        threads.append(cores)
+    return threads
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("corpus", help="Folder with labeled captcha images")
+    parser.add_argument("--model-dir", default=MODELS_FOLDER)
+    parser.add_argument("--variant", default=None, help="fp32, int8 or auto")
+    parser.add_argument("--resample", default="lanczos")
+    parser.add_argument(
+        "--batch-sizes", nargs="+", type=int, default=[1, 2, 4, 8, 16, 32, 64]
+    )
+    parser.add_argument("--threads", nargs="+", type=int, default=default_threads())
+    parser.add_argument(
+        "--min-images", type=int, default=512, help="images per throughput run"
+    )
+    parser.add_argument("-o", "--output", help="JSON file, stdout if omitted")
+    args = parser.parse_args()
+
+    with open("config.json", "r") as f:
+        model_options = json.load(f).get("captcha_model", {})
+    if args.variant:
+        model_options["variant"] = args.variant
+
+    corpus = load_corpus(args.corpus)
+    images = [image_bytes for image_bytes, _ in corpus]
+    labels = [label for _, label in corpus]
+
+    results = {
+        "timestamp": datetime.now(tz=timezone.utc).isoformat(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "ort_version": ort.__version__,
+        "resample": args.resample,
+        "samples": len(corpus),
+        "rss_before_load_mb": peak_rss_mb(),
+        "runs": [],
+    }
+
+    for threads in args.threads:
+        registry = CaptchaModelRegistry(args.model_dir)
+        registry.configure(**model_options)
+        registry.configure(intra_op_threads=threads, inter_op_threads=1)
+        onnx_session, metadata = registry.get()
+        solver = CaptchaSolver(onnx_session, metadata, args.resample)
+
+        latencies = []
+        solutions = []
+        for image_bytes in images:
+            started = time.perf_counter()
+            solutions.append(solver.solve(image_bytes))
+            latencies.append(time.perf_counter() - started)
+
+        batch_dim = onnx_session.get_inputs()[0].shape[0]
+        run = {
+            "threads": threads,
+            # Fixed batch models run larger batches one image at a time
+            "dynamic_batch": not (isinstance(batch_dim, int) and batch_dim == 1),
+            "variant": registry.variant,
+            "load_time": registry.load_time,
+            "latency": percentiles(latencies),
+            **accuracy(solutions, labels, metadata.get("output_positions", 4)),
+            "images_per_second": {
+                batch_size: throughput(
+                    onnx_session,
+                    metadata,
+                    args.resample,
+                    images,
+                    batch_size,
+                    args.min_images,
+                )
+                for batch_size in args.batch_sizes
+            },
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        results["runs"].append(run)
+
+        best = max(run["images_per_second"].items(), key=lambda item: item[1])
+        print(
+            f"threads {threads:>2}: {run['accuracy']:.2f}% accuracy, "
+            f"p50 {run['latency']['p50_ms']:.2f} ms, "
+            f"p99 {run['latency']['p99_ms']:.2f} ms, "
+            f"best {best[1]:.0f} img/s at batch {best[0]}",
+            file=sys.stderr,
+        )
+
+    output = json.dumps(results, indent=4)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
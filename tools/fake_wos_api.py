@@ -0,0 +1,283 @@
+"""
+Local stand-in for the WOS gift code API, for load testing without touching
+the real servers.
+
+Usage (from the repository root):
+    python -m tools.fake_wos_api --port 8780 --latency 0.05 --rate-limit 50
+
+then point `WOSClient(api_url="http://127.0.0.1:8780/api")` at it. Every
+player ID exists, requests must carry a valid `sign` (see `encode_data`),
+captchas are generated images of 4 characters, and the answers use the same
+messages and error codes as the real API.
+"""
+
+import argparse
+import asyncio
+import base64
+import io
+import json
+import random
+import secrets
+import time
+from collections import deque
+
+from aiohttp import web
+from PIL import Image, ImageDraw
+
+from utils.wos_api import encode_data
+
+CAPTCHA_CHARS = "ABCDEFGHIJKLMNPQRSTUVWXYZ23456789"
+
+
+def response(code: int, msg: str, err_code, data=None) -> dict:
+    return {
+        "code": code,
+        "data": data if data is not None else [],
+        "msg": msg,
+        "err_code": err_code,
+    }
+
+
+class RateLimit:
+    """At most `rate` requests in any one second window, None for no limit."""
+
+    def __init__(self, rate: float | None):
+        self.rate = rate
+        self.requests: deque[float] = deque()
+
+    def allow(self) -> bool:
+        if self.rate is None:
+            return True
+        now = time.monotonic()
+        while self.requests and now - self.requests[0] > 1.0:
+            self.requests.popleft()
+        if len(self.requests) >= self.rate:
+            return False
+        self.requests.append(now)
+        return True
+
+
+class FakeWOSServer:
+    """
+    aiohttp app implementing /api/player, /api/captcha and /api/gift_code.
+
+    `codes` maps the valid gift codes to their usage limit (None for
+    unlimited), codes in `expired` answer "TIME ERROR.". Requests over
+    `rate_limit` per second on an endpoint get a 429, like the real gateway,
+    and a player asking for captchas faster than `captcha_interval` gets
+    "CAPTCHA GET TOO FREQUENT.". Without `check_captcha` any captcha answer
+    is accepted, except for a `captcha_error_rate` share of random rejections.
+    `outage` makes an endpoint answer 502 for a while, to exercise the
+    engine's circuit breakers.
+    """
+
+    def __init__(
+        self,
+        codes: dict[str, int | None] | None = None,
+        expired: tuple[str, ...] = (),
+        latency: float = 0.05,
+        jitter: float = 0.02,
+        rate_limit: float | None = None,
+        captcha_interval: float = 0.0,
+        check_captcha: bool = False,
+        captcha_error_rate: float = 0.0,
+        image_size: tuple[int, int] = (150, 40),
+    ):
+        self.codes = codes if codes is not None else {"BENCHMARK": None}
+        self.expired = set(expired)
+        self.latency = latency
+        self.jitter = jitter
+        self.captcha_interval = captcha_interval
+        self.check_captcha = check_captcha
+        self.captcha_error_rate = captcha_error_rate
+        self.image_size = image_size
+
+        self.limits = {
+            name: RateLimit(rate_limit) for name in ("player", "captcha", "gift_code")
+        }
+        self.sessions: dict[str, int] = {}
+        self.captchas: dict[int, tuple[float, str]] = {}
+        self.redeemed: set[tuple[int, str]] = set()
+        self.uses: dict[str, int] = {}
+        self.requests = {name: 0 for name in self.limits}
+        self.down_until = {name: 0.0 for name in self.limits}
+
+        self.app = web.Application()
+        self.app.router.add_post("/api/player", self.handle_player)
+        self.app.router.add_post("/api/captcha", self.handle_captcha)
+        self.app.router.add_post("/api/gift_code", self.handle_gift_code)
+
+    async def _receive(self, request: web.Request, endpoint: str):
+        """Returns the form data, or the response to send instead."""
+        self.requests[endpoint] += 1
+        await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+        if time.monotonic() < self.down_until[endpoint]:
+            return None, web.Response(status=502, text="Bad Gateway")
+        if not self.limits[endpoint].allow():
+            return None, web.json_response(
+                response(1, "TOO MANY REQUESTS.", 0), status=429
+            )
+
+        form = dict(await request.post())
+        sign = form.pop("sign", None)
+        if sign != encode_data(form)["sign"]:
+            return None, web.json_response(response(1, "Sign Error", 0))
+        return form, None
+
+    def _logged_in(self, request: web.Request, fid: int) -> bool:
+        return self.sessions.get(request.cookies.get("wos_session")) == fid
+
+    def _captcha_image(self, text: str) -> str:
+        image = Image.new("L", self.image_size, color=235)
+        draw = ImageDraw.Draw(image)
+        step = self.image_size[0] // (len(text) + 1)
+        for i, char in enumerate(text):
+            draw.text(
+                (step // 2 + i * step + random.randint(-3, 3), random.randint(5, 15)),
+                char,
+                fill=random.randint(0, 80),
+            )
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG")
+        return "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+    async def handle_player(self, request: web.Request) -> web.Response:
+        form, error = await self._receive(request, "player")
+        if error is not None:
+            return error
+
+        fid = int(form["fid"])
+        token = secrets.token_hex(8)
+        self.sessions[token] = fid
+        payload = response(
+            0,
+            "success",
+            "",
+            {
+                "fid": fid,
+                "nickname": f"Player {fid}",
+                "kid": fid % 1000,
+                "stove_lv": 30,
+                "stove_lv_content": 30,
+                "avatar_image": "",
+            },
+        )
+        resp = web.json_response(payload)
+        resp.set_cookie("wos_session", token)
+        return resp
+
+    async def handle_captcha(self, request: web.Request) -> web.Response:
+        form, error = await self._receive(request, "captcha")
+        if error is not None:
+            return error
+
+        fid = int(form["fid"])
+        if not self._logged_in(request, fid):
+            return web.json_response(response(1, "NOT LOGIN.", 40009))
+        previous = self.captchas.get(fid)
+        if previous and time.monotonic() - previous[0] < self.captcha_interval:
+            return web.json_response(response(1, "CAPTCHA GET TOO FREQUENT.", 40101))
+
+        text = "".join(random.choices(CAPTCHA_CHARS, k=4))
+        self.captchas[fid] = (time.monotonic(), text)
+        return web.json_response(
+            response(0, "SUCCESS", 0, {"img": self._captcha_image(text)})
+        )
+
+    async def handle_gift_code(self, request: web.Request) -> web.Response:
+        form, error = await self._receive(request, "gift_code")
+        if error is not None:
+            return error
+
+        fid, code = int(form["fid"]), form["cdk"]
+        if not self._logged_in(request, fid):
+            return web.json_response(response(1, "NOT LOGIN.", 40009))
+
+        issued = self.captchas.pop(fid, None)
+        if (
+            issued is None
+            or (self.check_captcha and issued[1] != form["captcha_code"].upper())
+            or random.random() < self.captcha_error_rate
+        ):
+            return web.json_response(response(1, "CAPTCHA CHECK ERROR.", 40103))
+
+        if code in self.expired:
+            return web.json_response(response(1, "TIME ERROR.", 40007))
+        if code not in self.codes:
+            return web.json_response(response(1, "CDK NOT FOUND.", 40014))
+        if (fid, code) in self.redeemed:
+            return web.json_response(response(1, "RECEIVED.", 40008))
+        limit = self.codes[code]
+        if limit is not None and self.uses.get(code, 0) >= limit:
+            return web.json_response(response(1, "USED.", 40005))
+
+        self.redeemed.add((fid, code))
+        self.uses[code] = self.uses.get(code, 0) + 1
+        return web.json_response(response(0, "SUCCESS", 20000))
+
+    def outage(self, endpoint: str, duration: float, delay: float = 0.0):
+        """Takes `endpoint` down for `duration` seconds after `delay`."""
+        loop = asyncio.get_running_loop()
+        loop.call_later(
+            delay,
+            lambda: self.down_until.__setitem__(endpoint, time.monotonic() + duration),
+        )
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Serves the app on the running loop, returns its API URL."""
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = self.runner.addresses[0][1]
+        return f"http://{host}:{port}/api"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8780)
+    parser.add_argument(
+        "--codes", default='{"BENCHMARK": null}', help="JSON of code -> usage limit"
+    )
+    parser.add_argument("--expired", nargs="*", default=[])
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--rate-limit", type=float, default=None)
+    parser.add_argument("--captcha-interval", type=float, default=0.0)
+    parser.add_argument("--check-captcha", action="store_true")
+    parser.add_argument("--captcha-error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--outage",
+        nargs=3,
+        action="append",
+        default=[],
+        metavar=("ENDPOINT", "DELAY", "DURATION"),
+        help="answer 502 on an endpoint for DURATION seconds after DELAY",
+    )
+    args = parser.parse_args()
+
+    server = FakeWOSServer(
+        codes=json.loads(args.codes),
+        expired=tuple(args.expired),
+        latency=args.latency,
+        jitter=args.jitter,
+        rate_limit=args.rate_limit,
+        captcha_interval=args.captcha_interval,
+        check_captcha=args.check_captcha,
+        captcha_error_rate=args.captcha_error_rate,
+    )
+
+    async def schedule_outages(app):
+        for endpoint, delay, duration in args.outage:
+            server.outage(endpoint, float(duration), float(delay))
+
+    server.app.on_startup.append(schedule_outages)
+    web.run_app(server.app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
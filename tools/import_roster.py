@@ -0,0 +1,40 @@
+"""
+Imports players into the mass redeem roster.
+
+Usage (from the repository root):
+    python -m tools.import_roster data/ids.jsonc --guild 476835326220828682
+
+Accepts .json (IDs or objects), .jsonc (the commented ids.jsonc layout, where
+`// R5, R4` lines become tags and trailing comments names) and .csv files
+with fid, guild_id, name, tags and active columns. Every file is merged in
+one transaction.
+"""
+
+import argparse
+
+from orms.redemptions import create_tables
+from utils.roster import import_players, load_roster_file, tag_counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("files", nargs="+", help="Roster files to merge")
+    parser.add_argument(
+        "--guild", type=int, help="guild of players without one, all if omitted"
+    )
+    parser.add_argument("--replace-tags", action="store_true")
+    args = parser.parse_args()
+
+    create_tables()
+    for path in args.files:
+        added, updated = import_players(
+            load_roster_file(path), args.guild, args.replace_tags
+        )
+        print(f"{path}: {added} added, {updated} updated")
+
+    for tag, count in tag_counts(args.guild).items():
+        print(f"{tag:>12}: {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Produces the INT8 variant of the captcha model and evaluates every variant.
+
+Usage (from the repository root):
+    python -m tools.quantize_captcha_model data/captcha_corpus
+
+The corpus folder holds labeled captcha images (see `load_corpus`). For each
+variant an `<model>.eval.json` file with its accuracy and mean latency is
+written next to the model; the model registry uses those to pick the fastest
+variant that still meets the accuracy bar.
+
+Quantization needs the `onnx` package on top of the bot's requirements
+(`pip install onnx`, listed in requirements.txt).
+"""
+
+import argparse
+import json
+import os
+
+import onnxruntime as ort
+from onnxruntime.quantization import QuantType, quantize_dynamic
+
+from utils.captcha import (
+    MODEL_VARIANTS,
+    MODELS_FOLDER,
+    CaptchaModelRegistry,
+    evaluate_model,
+    load_corpus,
+    warmup_session,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("corpus", help="Folder with labeled captcha images")
+    parser.add_argument("--model-dir", default=MODELS_FOLDER)
+    parser.add_argument(
+        "--threads", type=int, default=1, help="intra-op threads used for timing"
+    )
+    args = parser.parse_args()
+
+    fp32_path = os.path.join(args.model_dir, MODEL_VARIANTS["fp32"])
+    int8_path = os.path.join(args.model_dir, MODEL_VARIANTS["int8"])
+
+    print(f"Quantizing {fp32_path} -> {int8_path}")
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+
+    registry = CaptchaModelRegistry(args.model_dir)
+    registry.configure(intra_op_threads=args.threads, inter_op_threads=1)
+    with open(os.path.join(args.model_dir, "captcha_model_metadata.json")) as f:
+        metadata = json.load(f)
+    corpus = load_corpus(args.corpus)
+    print(f"Evaluating on {len(corpus)} captchas")
+
+    results = {}
+    for variant, file_name in MODEL_VARIANTS.items():
+        model_path = os.path.join(args.model_dir, file_name)
+        onnx_session = ort.InferenceSession(
+            model_path,
+            sess_options=registry.session_options(),
+            providers=["CPUExecutionProvider"],
+        )
+        # Warm up so the first timed run doesn't include allocation
+        warmup_session(onnx_session, metadata)
+        results[variant] = evaluate_model(onnx_session, metadata, corpus)
+
+        with open(model_path.replace(".onnx", ".eval.json"), "w") as f:
+            json.dump(results[variant], f, indent=4)
+
+        print(
+            f"{variant:>5}: {results[variant]['accuracy']:.2f}% accuracy, "
+            f"{results[variant]['latency_ms']:.3f} ms/captcha"
+        )
+
+    if results["int8"]["latency_ms"]:
+        speedup = results["fp32"]["latency_ms"] / results["int8"]["latency_ms"]
+        print(f"INT8 speedup: {speedup:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
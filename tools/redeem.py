@@ -0,0 +1,144 @@
+"""
+Headless batch redeemer, streaming one JSON line per outcome.
+
+Usage (from the repository root):
+    python -m tools.redeem CODE1 CODE2 --tag r4 -o results.jsonl
+    python -m tools.redeem CODE --players 349659840 351626359
+
+Players are picked from the roster by guild and tag, like /mass_redeem, or
+given explicitly. All codes are redeemed in one
+pass, with the engine, settings and captcha solver the bot uses, so every
+player logs in only once. Every (player, code) outcome is written as soon as
+it's known:
+
+    {"player_id": 349659840, "code": "CODE1", "outcome": "success",
+     "err_code": 20000, "time": 1760000000}
+
+A summary per code goes to stderr.
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+from orms.redemptions import create_tables
+from utils.captcha import CaptchaBatcher, captcha_models
+from utils.gift_codes import GiftCodeRedeemer
+from utils.inference import InferenceExecutor
+from utils.ledger import Ledger
+from utils.redemption import RedeemOutcome, RedemptionEngine
+from utils.roster import select_players
+from utils.solver_service import RemoteCaptchaSolver
+from utils.wos_api import StoveInfoCache, WOSClient, wos_api_url
+
+
+def pick_players(args) -> list[int]:
+    if args.players:
+        return args.players
+    return select_players(guild_id=args.guild, tags=args.tag, limit=args.limit)
+
+
+def build_solver(config: dict):
+    """Returns `(solver, executor)`, the executor is None for the remote solver."""
+    service_config = config.get("captcha_service", {})
+    if service_config.get("enabled", False):
+        solver = RemoteCaptchaSolver(
+            url=f"http://{service_config.get('host', '127.0.0.1')}:"
+            f"{service_config.get('port', 8765)}",
+            socket_path=service_config.get("socket_path"),
+            timeout=service_config.get("timeout", 10.0),
+        )
+        return solver, None
+    captcha_models.configure(**config.get("captcha_model", {}))
+    executor = InferenceExecutor(**config.get("inference", {}))
+    return CaptchaBatcher(executor), executor
+
+
+async def run(args, config: dict, output):
+    create_tables()
+    stove_cache_config = dict(config.get("stove_cache", {}))
+    stove_cache = (
+        StoveInfoCache(**stove_cache_config)
+        if stove_cache_config.pop("enabled", True)
+        else None
+    )
+    client = WOSClient(
+        stove_cache=stove_cache, api_url=args.api_url, **config.get("wos_api", {})
+    )
+    solver, executor = build_solver(config)
+    if executor is not None:
+        await executor.warmup()
+
+    engine = RedemptionEngine(
+        GiftCodeRedeemer(client, solver),
+        ledger=Ledger() if args.ledger else None,
+        **config.get("redemption", {}),
+    )
+    player_ids = pick_players(args)
+
+    def write(player_id: int, code: str, outcome: RedeemOutcome, err_code):
+        line = {
+            "player_id": player_id,
+            "code": code,
+            "outcome": outcome.value,
+            "err_code": err_code,
+            "time": int(time.time()),
+        }
+        output.write(json.dumps(line) + "\n")
+        output.flush()
+
+    try:
+        # One pass for all codes, each player logs in once
+        reports = await engine.run_codes(player_ids, args.codes, on_outcome=write)
+        for code, report in reports.items():
+            print(
+                f"{code}: {len(report.success)} redeemed, "
+                f"{len(report.already_redeemed)} already redeemed, "
+                f"{len(report.fail)} failed, {report.skipped} skipped"
+                + (f", aborted: {report.aborted.value}" if report.aborted else ""),
+                file=sys.stderr,
+            )
+        print(
+            f"{len(player_ids)} players x {len(reports)} codes "
+            f"in {report.elapsed:.1f}s",
+            file=sys.stderr,
+        )
+    finally:
+        await client.close()
+        if executor is not None:
+            executor.shutdown()
+        if isinstance(solver, RemoteCaptchaSolver):
+            await solver.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("codes", nargs="+", help="Gift codes to redeem")
+    parser.add_argument("--guild", type=int, help="roster guild ID")
+    parser.add_argument("--tag", nargs="+", help="roster tags, any of them")
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--players", nargs="+", type=int, help="explicit player IDs")
+    parser.add_argument("-o", "--output", help="JSONL file, stdout if omitted")
+    parser.add_argument(
+        "--ledger",
+        action="store_true",
+        help="skip players with a known outcome and record new ones",
+    )
+    parser.add_argument("--api-url", default=wos_api_url)
+    args = parser.parse_args()
+
+    with open("config.json", "r") as f:
+        config = json.load(f)
+
+    output = open(args.output, "a") if args.output else sys.stdout
+    try:
+        asyncio.run(run(args, config, output))
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
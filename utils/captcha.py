@@ -0,0 +1,579 @@
+import asyncio
+import hashlib
+import io
+import json
+import os
+import platform
+import threading
+import time
+from collections import OrderedDict, deque
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+import onnxruntime as ort
+from PIL import Image
+
+MODELS_FOLDER = os.path.join("resources", "models")
+
+RESAMPLING_FILTERS = {
+    "nearest": Image.NEAREST,
+    "box": Image.BOX,
+    "bilinear": Image.BILINEAR,
+    "hamming": Image.HAMMING,
+    "bicubic": Image.BICUBIC,
+    "lanczos": Image.LANCZOS,
+}
+
+
+class CaptchaPreprocessor:
+    """
+    Decodes captcha images straight into a preallocated (N, 1, H, W) float32
+    buffer and normalizes them in place.
+
+    The returned arrays are views into that buffer, so they're only valid
+    until the next call - run inference on them before preprocessing again.
+    """
+
+    def __init__(self, metadata: dict, resample: str = "lanczos", max_batch: int = 1):
+        self.height, self.width = metadata["input_shape"][1:3]
+        self.resample = RESAMPLING_FILTERS[resample]
+        mean = metadata["normalization"]["mean"][0]
+        std = metadata["normalization"]["std"][0]
+        # (x / 255 - mean) / std == x * scale + offset
+        self.scale = np.float32(1.0 / (255.0 * std))
+        self.offset = np.float32(-mean / std)
+        self.buffer = np.empty((max_batch, 1, self.height, self.width), np.float32)
+
+    def _ensure_capacity(self, size: int):
+        if size > self.buffer.shape[0]:
+            self.buffer = np.empty((size, 1, self.height, self.width), np.float32)
+
+    def _fill(self, image_bytes: bytes, out: np.ndarray):
+        image = Image.open(io.BytesIO(image_bytes)).convert("L")
+        if image.size != (self.width, self.height):
+            image = image.resize((self.width, self.height), self.resample)
+        np.multiply(np.asarray(image), self.scale, out=out, casting="unsafe")
+        out += self.offset
+
+    def __call__(self, image_bytes: bytes) -> np.ndarray:
+        """Returns a (1, 1, H, W) batch for a single image."""
+        self._fill(image_bytes, self.buffer[0, 0])
+        return self.buffer[:1]
+
+    def batch(self, images: list[bytes]) -> np.ndarray:
+        """Returns one contiguous (N, 1, H, W) batch for a list of images."""
+        self._ensure_capacity(len(images))
+        for i, image_bytes in enumerate(images):
+            self._fill(image_bytes, self.buffer[i, 0])
+        return self.buffer[: len(images)]
+
+
+def load_corpus(folder: str) -> list[tuple[bytes, str]]:
+    """
+    Loads a labeled captcha corpus. The label is the file name up to the first
+    underscore, e.g. `AB3K.png` or `AB3K_2.png`.
+    """
+    corpus = []
+    for path in sorted(Path(folder).iterdir()):
+        if path.suffix.lower() not in (".png", ".jpg", ".jpeg"):
+            continue
+        corpus.append((path.read_bytes(), path.stem.split("_")[0].upper()))
+    return corpus
+
+
+def warmup_session(onnx_session, metadata: dict):
+    """One dummy inference, so the first real one doesn't pay for allocation."""
+    height, width = metadata["input_shape"][1:3]
+    dummy = np.zeros((1, 1, height, width), dtype=np.float32)
+    onnx_session.run(None, {onnx_session.get_inputs()[0].name: dummy})
+
+
+def corpus_accuracy(
+    onnx_session, metadata: dict, corpus: list[tuple[bytes, str]], resample="lanczos"
+) -> float:
+    """Percentage of corpus captchas decoded correctly with the given filter."""
+    return evaluate_model(onnx_session, metadata, corpus, resample)["accuracy"]
+
+
+def evaluate_model(
+    onnx_session, metadata: dict, corpus: list[tuple[bytes, str]], resample="lanczos"
+) -> dict:
+    """Corpus accuracy and mean single-image inference latency of a session."""
+    preprocessor = CaptchaPreprocessor(metadata, resample)
+    input_name = onnx_session.get_inputs()[0].name
+    correct = 0
+    inference_time = 0.0
+    for image_bytes, label in corpus:
+        tensor = preprocessor(image_bytes)
+        started = time.perf_counter()
+        outputs = onnx_session.run(None, {input_name: tensor})
+        inference_time += time.perf_counter() - started
+        correct += decode(outputs, metadata).text == label
+    return {
+        "accuracy": correct / len(corpus) * 100 if corpus else 0.0,
+        "latency_ms": inference_time / len(corpus) * 1000 if corpus else 0.0,
+        "samples": len(corpus),
+        "ort_version": ort.__version__,
+    }
+
+
+def pick_resampling_filter(
+    onnx_session,
+    metadata: dict,
+    corpus: list[tuple[bytes, str]],
+    tolerance: float = 0.5,
+) -> tuple[str, dict[str, float]]:
+    """
+    Returns the cheapest resampling filter whose corpus accuracy is within
+    `tolerance` percentage points of LANCZOS, together with all the scores.
+    """
+    scores = {
+        name: corpus_accuracy(onnx_session, metadata, corpus, name)
+        for name in RESAMPLING_FILTERS
+    }
+    baseline = scores["lanczos"]
+    # RESAMPLING_FILTERS is ordered from the cheapest filter to the most expensive
+    for name, accuracy in scores.items():
+        if accuracy >= baseline - tolerance:
+            return name, scores
+    return "lanczos", scores
+
+
+class CaptchaSolution(NamedTuple):
+    text: str
+    # Softmax probability of the chosen class at each position
+    char_confidences: tuple[float, ...]
+
+    @property
+    def confidence(self) -> float:
+        """Confidence of the weakest character - one wrong character fails it."""
+        return min(self.char_confidences, default=0.0)
+
+
+def _softmax(scores: np.ndarray) -> np.ndarray:
+    # Heads exported with a softmax already produce probabilities
+    if scores.min() >= 0 and abs(scores.sum() - 1.0) < 1e-3:
+        return scores
+    exp = np.exp(scores - scores.max())
+    return exp / exp.sum()
+
+
+def decode(outputs, metadata: dict, row: int = 0) -> CaptchaSolution:
+    """
+    Reads the 4 output heads of the model for a single row of the batch.
+    """
+    idx_to_char = metadata["idx_to_char"]
+    result = ""
+    confidences = []
+
+    for pos in range(metadata.get("output_positions", 4)):
+        probabilities = _softmax(outputs[pos][row])
+        char_idx = int(np.argmax(probabilities))
+        result += idx_to_char[str(char_idx)]
+        confidences.append(float(probabilities[char_idx]))
+
+    return CaptchaSolution(result, tuple(confidences))
+
+
+class CaptchaResultCache:
+    """
+    LRU cache of verified captcha answers keyed by a hash of the image bytes.
+
+    Only answers the server accepted are stored, and an answer the server
+    rejects is dropped, so a hit can be submitted without running the model.
+    """
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._entries: OrderedDict[bytes, str] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(image_bytes: bytes) -> bytes:
+        return hashlib.blake2b(image_bytes, digest_size=16).digest()
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, key: bytes) -> str | None:
+        text = self._entries.get(key)
+        if text is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return text
+
+    def put(self, key: bytes, text: str):
+        self._entries[key] = text
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def discard(self, key: bytes):
+        self._entries.pop(key, None)
+
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+
+MODEL_VARIANTS = {
+    "fp32": "captcha_model.onnx",
+    "int8": "captcha_model.int8.onnx",
+}
+
+
+def file_sha256(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def cpu_model() -> str:
+    """CPU model name, the graph optimized at "all" only fits this CPU."""
+    try:
+        with open("/proc/cpuinfo", "r") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+class CaptchaModelRegistry:
+    """
+    Process-wide holder of the captcha model.
+
+    The ONNX session and its metadata are loaded once, on first use, with the
+    configured SessionOptions and a warmup inference, so the first redemption
+    doesn't pay for model loading.
+
+    With `variant` set to "auto" the fastest model variant whose evaluation
+    (`<model>.eval.json`, written by tools/quantize_captcha_model.py) meets
+    `min_accuracy` is used. The optimized graph of the chosen variant is
+    cached next to it as `<model>.optimized.onnx` and reused as long as the
+    source model, ONNX Runtime version and optimization level are unchanged.
+    """
+
+    def __init__(self, model_dir: str = MODELS_FOLDER):
+        self.model_dir = model_dir
+        self.options = {
+            "intra_op_threads": 0,
+            "inter_op_threads": 0,
+            "graph_optimization": "all",
+            "enable_cpu_mem_arena": True,
+            "enable_mem_pattern": True,
+            "variant": "auto",
+            "min_accuracy": None,
+            "cache_optimized_graph": True,
+        }
+        self._lock = threading.Lock()
+        self._model = None
+
+        self.load_time: float | None = None
+        self.warmup_time: float | None = None
+        self.last_error: str | None = None
+        self.variant: str | None = None
+        self.graph_cache_hit = False
+
+    def configure(self, **options):
+        """Overrides session options; takes effect on the next load."""
+        self.options.update(options)
+
+    def session_options(self) -> ort.SessionOptions:
+        session_options = ort.SessionOptions()
+        session_options.intra_op_num_threads = self.options["intra_op_threads"]
+        session_options.inter_op_num_threads = self.options["inter_op_threads"]
+        session_options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[
+            self.options["graph_optimization"]
+        ]
+        session_options.enable_cpu_mem_arena = self.options["enable_cpu_mem_arena"]
+        session_options.enable_mem_pattern = self.options["enable_mem_pattern"]
+        return session_options
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    @property
+    def healthy(self) -> bool:
+        return self.loaded and self.last_error is None
+
+    def health(self) -> dict:
+        return {
+            "loaded": self.loaded,
+            "healthy": self.healthy,
+            "load_time": self.load_time,
+            "warmup_time": self.warmup_time,
+            "last_error": self.last_error,
+            "variant": self.variant,
+            "graph_cache_hit": self.graph_cache_hit,
+        }
+
+    def get(self):
+        """Returns `(onnx_session, metadata)`, loading the model if needed."""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._load()
+        return self._model
+
+    def reset(self):
+        with self._lock:
+            self._model = None
+
+    def _model_path(self, variant: str) -> str:
+        return os.path.join(self.model_dir, MODEL_VARIANTS[variant])
+
+    def _read_sidecar(self, path: str) -> dict | None:
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def pick_variant(self, metadata: dict) -> str:
+        if self.options["variant"] != "auto":
+            return self.options["variant"]
+
+        min_accuracy = self.options["min_accuracy"]
+        if min_accuracy is None:
+            min_accuracy = metadata.get("best_accuracy", 0) - 1.0
+
+        best, best_latency = "fp32", None
+        for variant in MODEL_VARIANTS:
+            model_path = self._model_path(variant)
+            evaluation = self._read_sidecar(model_path.replace(".onnx", ".eval.json"))
+            if not os.path.exists(model_path) or not evaluation:
+                continue
+            if evaluation["accuracy"] < min_accuracy:
+                continue
+            if best_latency is None or evaluation["latency_ms"] < best_latency:
+                best, best_latency = variant, evaluation["latency_ms"]
+        return best
+
+    def _create_session(self, model_path: str) -> ort.InferenceSession:
+        session_options = self.session_options()
+        self.graph_cache_hit = False
+        if not self.options["cache_optimized_graph"]:
+            return ort.InferenceSession(
+                model_path,
+                sess_options=session_options,
+                providers=["CPUExecutionProvider"],
+            )
+
+        cache_path = model_path.replace(".onnx", ".optimized.onnx")
+        cache_info_path = model_path.replace(".onnx", ".optimized.json")
+        cache_info = {
+            "source_sha256": file_sha256(model_path),
+            "ort_version": ort.__version__,
+            "graph_optimization": self.options["graph_optimization"],
+            "providers": ["CPUExecutionProvider"],
+            "machine": platform.machine(),
+            "cpu": cpu_model(),
+        }
+
+        if (
+            os.path.exists(cache_path)
+            and self._read_sidecar(cache_info_path) == cache_info
+        ):
+            # The graph is already optimized, don't spend time on it again
+            session_options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[
+                "disable"
+            ]
+            self.graph_cache_hit = True
+            return ort.InferenceSession(
+                cache_path,
+                sess_options=session_options,
+                providers=["CPUExecutionProvider"],
+            )
+
+        # Written under a temporary name first, worker processes may load the
+        # model at the same time. ORT picks the format by extension.
+        temp_suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        temp_cache_path = cache_path.replace(".onnx", f"{temp_suffix}.onnx")
+        session_options.optimized_model_filepath = temp_cache_path
+        onnx_session = ort.InferenceSession(
+            model_path,
+            sess_options=session_options,
+            providers=["CPUExecutionProvider"],
+        )
+        os.replace(temp_cache_path, cache_path)
+        with open(cache_info_path + temp_suffix, "w") as f:
+            json.dump(cache_info, f, indent=4)
+        os.replace(cache_info_path + temp_suffix, cache_info_path)
+        return onnx_session
+
+    def _load(self):
+        started = time.perf_counter()
+        try:
+            with open(
+                os.path.join(self.model_dir, "captcha_model_metadata.json"), "r"
+            ) as f:
+                metadata = json.load(f)
+            self.variant = self.pick_variant(metadata)
+            onnx_session = self._create_session(self._model_path(self.variant))
+        except Exception as e:
+            self.last_error = f"{type(e).__name__}: {e}"
+            raise
+        self.load_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        try:
+            warmup_session(onnx_session, metadata)
+            self.last_error = None
+        except Exception as e:
+            self.last_error = f"Warmup failed: {type(e).__name__}: {e}"
+        self.warmup_time = time.perf_counter() - started
+
+        return onnx_session, metadata
+
+
+captcha_models = CaptchaModelRegistry()
+
+
+def infer_batch(
+    onnx_session, metadata: dict, preprocessor: CaptchaPreprocessor, images
+) -> list[CaptchaSolution]:
+    """Runs a list of captcha images through the model, as one batch if it can."""
+    model_input = onnx_session.get_inputs()[0]
+    # Models exported with a fixed batch dimension can't take stacked input
+    if isinstance(model_input.shape[0], int) and model_input.shape[0] == 1:
+        results = []
+        for image_bytes in images:
+            outputs = onnx_session.run(
+                None, {model_input.name: preprocessor(image_bytes)}
+            )
+            results.append(decode(outputs, metadata))
+        return results
+
+    outputs = onnx_session.run(None, {model_input.name: preprocessor.batch(images)})
+    return [decode(outputs, metadata, row) for row in range(len(images))]
+
+
+class CaptchaBatcher:
+    """
+    Shared inference queue for captcha images.
+
+    Pending images are collected for up to `max_wait` seconds (or until the
+    current batch size is reached) and handed to the inference `executor` as
+    one batch. Up to `executor.workers` batches run at the same time. The
+    batch size adapts to the queue depth and `latency_target`: it halves when
+    a batch runs over the target and doubles while there's a backlog and
+    batches finish well under it.
+    """
+
+    def __init__(
+        self,
+        executor,
+        max_batch: int = 32,
+        max_wait: float = 0.005,
+        latency_target: float = 0.05,
+    ):
+        self.executor = executor
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.latency_target = latency_target
+        self.batch_size = min(8, max_batch)
+
+        self._pending: deque[tuple[bytes, asyncio.Future]] = deque()
+        self._ready = asyncio.Event()
+        self._runner: asyncio.Task | None = None
+        self._slots = asyncio.Semaphore(max(1, executor.workers))
+
+        self.batches = 0
+        self.items = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._pending)
+
+    async def solve(self, image_bytes: bytes) -> CaptchaSolution:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((image_bytes, future))
+
+        if len(self._pending) >= self.batch_size:
+            self._ready.set()
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(self._run())
+
+        return await future
+
+    async def _run(self):
+        batches = set()
+
+        # Stays alive until batches in flight are done, images queued while
+        # they run would otherwise be left without a runner
+        while self._pending or batches:
+            if not self._pending:
+                await asyncio.wait(set(batches), return_when=asyncio.FIRST_COMPLETED)
+                continue
+            if len(self._pending) < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._ready.wait(), timeout=self.max_wait)
+                except asyncio.TimeoutError:
+                    pass
+            self._ready.clear()
+
+            await self._slots.acquire()
+            batch = [
+                self._pending.popleft()
+                for _ in range(min(self.batch_size, len(self._pending)))
+            ]
+            task = asyncio.create_task(self._run_batch(batch))
+            batches.add(task)
+            task.add_done_callback(batches.discard)
+
+    async def _run_batch(self, batch: list[tuple[bytes, asyncio.Future]]):
+        started = time.perf_counter()
+        try:
+            results = await self.executor.run_batch(
+                [image_bytes for image_bytes, _ in batch]
+            )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._slots.release()
+        elapsed = time.perf_counter() - started
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+        self.batches += 1
+        self.items += len(batch)
+        self._adapt(elapsed)
+
+    def _adapt(self, elapsed: float):
+        if elapsed > self.latency_target and self.batch_size > 1:
+            self.batch_size = max(1, self.batch_size // 2)
+        elif (
+            len(self._pending) > 0
+            and elapsed < self.latency_target / 2
+            and self.batch_size < self.max_batch
+        ):
+            self.batch_size = min(self.max_batch, self.batch_size * 2)
+
+
+if __name__ == "__main__":
+    import sys
+
+    # python -m utils.captcha <corpus folder>
+    onnx_session, metadata = captcha_models.get()
+    corpus = load_corpus(sys.argv[1])
+    best, scores = pick_resampling_filter(onnx_session, metadata, corpus)
+    for name, accuracy in scores.items():
+        print(f"{name:>8}: {accuracy:.2f}%")
+    print(f"Cheapest filter within tolerance: {best}")
@@ -0,0 +1,151 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from utils.captcha import (
+    CaptchaPreprocessor,
+    CaptchaSolution,
+    captcha_models,
+    infer_batch,
+)
+
+INFERENCE_MODES = ("inline", "thread", "process")
+
+
+class InferenceError(RuntimeError):
+    """The inference workers died, the batch wasn't run."""
+
+
+# Per worker process state, set up by _init_process_worker
+_worker_model = None
+_worker_preprocessor: CaptchaPreprocessor | None = None
+
+
+def _init_process_worker(model_options: dict, model_dir: str, resample: str):
+    global _worker_model, _worker_preprocessor
+    captcha_models.model_dir = model_dir
+    captcha_models.configure(**model_options)
+    _worker_model = captcha_models.get()
+    _worker_preprocessor = CaptchaPreprocessor(_worker_model[1], resample)
+
+
+def _process_infer(images: list[bytes]) -> list[CaptchaSolution]:
+    onnx_session, metadata = _worker_model
+    return infer_batch(onnx_session, metadata, _worker_preprocessor, images)
+
+
+class InferenceExecutor:
+    """
+    Runs captcha batches for `CaptchaBatcher`.
+
+    "inline" runs them on the event loop thread, which blocks the bot for the
+    duration of every batch and is only meant as a baseline. In "thread" mode
+    `workers` threads share the registry's ONNX session
+    (`InferenceSession.run` is thread-safe), each with its own preprocessing
+    buffer. In "process" mode every worker process loads its own session with
+    the same options, which sidesteps the GIL held during preprocessing and
+    decoding at the cost of one model copy per worker. Spawned workers import
+    the main module (bot.py), so it has to stay safe to import; if they die
+    anyway, batches fail with `InferenceError` and the next one starts a new
+    pool.
+
+    Pair `workers` with the model's `intra_op_threads` so workers times
+    threads doesn't exceed the CPU cores available.
+    """
+
+    def __init__(
+        self,
+        mode: str = "thread",
+        workers: int | None = None,
+        resample: str = "lanczos",
+        model_options: dict | None = None,
+    ):
+        if mode not in INFERENCE_MODES:
+            raise ValueError(f"Unknown inference mode: {mode}")
+        self.mode = mode
+        if mode == "inline":
+            workers = 1
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.resample = resample
+        self.model_options = (
+            dict(captcha_models.options) if model_options is None else model_options
+        )
+
+        self._executor: Executor | None = None
+        self._local = threading.local()
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.mode == "process":
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    # Forking a process that already runs ONNX threads isn't safe
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_process_worker,
+                    initargs=(
+                        self.model_options,
+                        captcha_models.model_dir,
+                        self.resample,
+                    ),
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="captcha"
+                )
+        return self._executor
+
+    def _thread_infer(self, images: list[bytes]) -> list[CaptchaSolution]:
+        onnx_session, metadata = captcha_models.get()
+        preprocessor = getattr(self._local, "preprocessor", None)
+        if preprocessor is None:
+            preprocessor = CaptchaPreprocessor(metadata, self.resample)
+            self._local.preprocessor = preprocessor
+        return infer_batch(onnx_session, metadata, preprocessor, images)
+
+    async def run_batch(self, images: list[bytes]) -> list[CaptchaSolution]:
+        if self.mode == "inline":
+            return self._thread_infer(images)
+        function = _process_infer if self.mode == "process" else self._thread_infer
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._get_executor(), function, images
+            )
+        except BrokenProcessPool as e:
+            raise self._broken_pool(e) from e
+
+    async def warmup(self):
+        """Starts every worker, so the first real batch doesn't load the model."""
+        if self.mode != "process":
+            await asyncio.to_thread(captcha_models.get)
+            return
+        executor = self._get_executor()
+        loop = asyncio.get_running_loop()
+        # Submitting one no-op per worker makes the pool spawn all of them
+        try:
+            await asyncio.gather(
+                *(
+                    loop.run_in_executor(executor, os.getpid)
+                    for _ in range(self.workers)
+                )
+            )
+        except BrokenProcessPool as e:
+            raise self._broken_pool(e) from e
+
+    def _broken_pool(self, error: BrokenProcessPool) -> InferenceError:
+        # The next batch starts a fresh pool, in case a worker just crashed
+        self.shutdown()
+        message = (
+            f"Inference worker processes died ({error}). Spawned workers import "
+            "the main module, make sure it's safe to import, or run the model "
+            "behind utils.solver_service"
+        )
+        print(message)
+        return InferenceError(message)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,246 @@
+import asyncio
+import json
+from datetime import datetime, timezone
+from enum import Enum
+from typing import Any, Awaitable, Callable, Optional
+
+from orms.redemptions import RedemptionJob
+from utils.redemption import RedemptionEngine, RedemptionReport
+from utils.roster import mark_seen
+from utils.utils import small_traceback, timestamp
+
+
+class JobStatus(Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    FINISHED = "finished"
+    ABORTED = "aborted"
+    CANCELLED = "cancelled"
+    FAILED = "failed"
+
+
+ACTIVE_STATUSES = (JobStatus.QUEUED.value, JobStatus.RUNNING.value)
+
+
+class JobManager:
+    """
+    Persistent queue of mass redemption jobs.
+
+    A job redeems one or more gift codes for the same players in one pass, so
+    every player logs in once. Jobs are stored in SQLite and started in FIFO
+    order while fewer than `max_concurrent` jobs run overall and fewer than
+    `per_guild` run for the job's guild. Running jobs of different guilds
+    share the API rate through the engine's fair scheduler, so a small job
+    doesn't wait for a big one.
+    Jobs that were queued or running when the bot stopped are picked up again
+    by `resume`; the redemption ledger makes the engine skip the players they
+    had already finished.
+    """
+
+    def __init__(
+        self,
+        get_engine: Callable[[], Awaitable[RedemptionEngine]],
+        max_concurrent: int = 2,
+        per_guild: int = 1,
+        on_start: Optional[Callable[[RedemptionJob], Awaitable]] = None,
+        on_progress: Optional[
+            Callable[[RedemptionJob, dict[str, RedemptionReport]], Any]
+        ] = None,
+        on_finish: Optional[
+            Callable[[RedemptionJob, Optional[dict[str, RedemptionReport]]], Awaitable]
+        ] = None,
+    ):
+        self.get_engine = get_engine
+        self.max_concurrent = max_concurrent
+        self.per_guild = per_guild
+        self.on_start = on_start
+        self.on_progress = on_progress
+        self.on_finish = on_finish
+
+        self.tasks: dict[int, asyncio.Task] = {}
+        self.running: dict[int, RedemptionJob] = {}
+        # Reports of running jobs by code, once their first result is in
+        self.reports: dict[int, dict[str, RedemptionReport]] = {}
+        self._cancelled: set[int] = set()
+
+    def enqueue(
+        self,
+        guild_id: int,
+        channel_id: int,
+        user_id: int,
+        gift_codes: list[str],
+        player_ids: list[int],
+        locale: Optional[str] = None,
+        parent_id: Optional[int] = None,
+    ) -> RedemptionJob:
+        job = RedemptionJob.create(
+            guild_id=guild_id,
+            channel_id=channel_id,
+            user_id=user_id,
+            locale=locale,
+            gift_code=" ".join(gift_codes),
+            player_ids=json.dumps(player_ids),
+            parent_id=parent_id,
+            status=JobStatus.QUEUED.value,
+            created_at=timestamp(datetime.now(tz=timezone.utc)),
+        )
+        self._schedule()
+        return job
+
+    def resume(self) -> list[RedemptionJob]:
+        """Re-queues jobs left unfinished by the previous run of the bot."""
+        jobs = list(
+            RedemptionJob.select()
+            .where(RedemptionJob.status.in_(ACTIVE_STATUSES))
+            .order_by(RedemptionJob.id)
+        )
+        for job in jobs:
+            if job.status == JobStatus.RUNNING.value:
+                job.status = JobStatus.QUEUED.value
+                job.save()
+        self._schedule()
+        return jobs
+
+    def active(self, guild_id: int) -> list[RedemptionJob]:
+        return list(
+            RedemptionJob.select()
+            .where(
+                (RedemptionJob.guild_id == guild_id)
+                & (RedemptionJob.status.in_(ACTIVE_STATUSES))
+            )
+            .order_by(RedemptionJob.id)
+        )
+
+    def queue_position(self, job: RedemptionJob) -> int:
+        """1-based position among all queued jobs, 0 if it's not queued."""
+        if job.id in self.running:
+            return 0
+        return (
+            RedemptionJob.select()
+            .where(
+                (RedemptionJob.status == JobStatus.QUEUED.value)
+                & (RedemptionJob.id <= job.id)
+            )
+            .count()
+        )
+
+    async def cancel(self, job_id: int, guild_id: int) -> bool:
+        job = RedemptionJob.get_or_none(
+            (RedemptionJob.id == job_id) & (RedemptionJob.guild_id == guild_id)
+        )
+        if job is None or job.status not in ACTIVE_STATUSES:
+            return False
+
+        task = self.tasks.get(job_id)
+        if task is not None:
+            self._cancelled.add(job_id)
+            task.cancel()
+            # _run records the cancellation and calls on_finish
+            await asyncio.gather(task, return_exceptions=True)
+        else:
+            job.status = JobStatus.CANCELLED.value
+            job.finished_at = timestamp(datetime.now(tz=timezone.utc))
+            job.save()
+        return True
+
+    async def shutdown(self):
+        """Stops running jobs without marking them, so `resume` restarts them."""
+        for task in self.tasks.values():
+            task.cancel()
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+
+    def _schedule(self):
+        queued = (
+            RedemptionJob.select()
+            .where(RedemptionJob.status == JobStatus.QUEUED.value)
+            .order_by(RedemptionJob.id)
+        )
+        for job in queued:
+            if len(self.running) >= self.max_concurrent:
+                break
+            if job.id in self.running:
+                continue
+            guild_running = sum(
+                1
+                for running in self.running.values()
+                if running.guild_id == job.guild_id
+            )
+            if guild_running >= self.per_guild:
+                continue
+
+            self.running[job.id] = job
+            self.tasks[job.id] = asyncio.create_task(self._run(job))
+
+    async def _run(self, job: RedemptionJob):
+        job.status = JobStatus.RUNNING.value
+        job.started_at = timestamp(datetime.now(tz=timezone.utc))
+        job.save()
+
+        def on_result(report: RedemptionReport):
+            reports = self.reports.setdefault(job.id, {})
+            reports[report.code] = report
+            if self.on_progress:
+                return self.on_progress(job, reports)
+
+        reports = None
+        try:
+            if self.on_start:
+                await self.on_start(job)
+            engine = await self.get_engine()
+            reports = await engine.run_codes(
+                json.loads(job.player_ids),
+                job.gift_codes,
+                on_result=on_result,
+                flow=job.guild_id,
+            )
+            job.status = (
+                JobStatus.ABORTED.value
+                if all(report.aborted for report in reports.values())
+                else JobStatus.FINISHED.value
+            )
+        except asyncio.CancelledError:
+            if job.id not in self._cancelled:
+                # Bot is shutting down, leave the job for resume()
+                self.tasks.pop(job.id, None)
+                self.running.pop(job.id, None)
+                raise
+            self._cancelled.discard(job.id)
+            job.status = JobStatus.CANCELLED.value
+            reports = self.reports.get(job.id)
+        except Exception as e:
+            print(small_traceback(e, f"Redemption job {job.id} failed"))
+            job.status = JobStatus.FAILED.value
+            reports = self.reports.get(job.id)
+
+        job.finished_at = timestamp(datetime.now(tz=timezone.utc))
+        if reports:
+            # Totals over all codes, failed players by code
+            job.success = sum(len(report.success) for report in reports.values())
+            job.already_redeemed = sum(
+                len(report.already_redeemed) for report in reports.values()
+            )
+            job.fail = sum(len(report.fail) for report in reports.values())
+            job.failed_ids = json.dumps(
+                {code: report.fail for code, report in reports.items()}
+            )
+            mark_seen(
+                list(
+                    {
+                        player_id
+                        for report in reports.values()
+                        for player_id in report.answered
+                    }
+                )
+            )
+        job.save()
+
+        self.tasks.pop(job.id, None)
+        self.running.pop(job.id, None)
+        self.reports.pop(job.id, None)
+        self._schedule()
+
+        if self.on_finish:
+            try:
+                await self.on_finish(job, reports)
+            except Exception as e:
+                print(small_traceback(e, f"Finishing redemption job {job.id} failed"))
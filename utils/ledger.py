@@ -0,0 +1,77 @@
+import time
+from datetime import datetime, timezone
+
+from orms.redemptions import RedemptionLedger, database
+from utils.redemption import RedeemOutcome
+from utils.utils import timestamp
+
+# Outcomes that won't change no matter how often the code is redeemed again
+FINAL_OUTCOMES = (RedeemOutcome.SUCCESS, RedeemOutcome.ALREADY_REDEEMED)
+
+
+class Ledger:
+    """
+    Persistent record of (player, gift code) redemption outcomes.
+
+    Results are buffered and written in one transaction every `batch_size`
+    results or `flush_interval` seconds, whichever comes first.
+    """
+
+    def __init__(self, batch_size: int = 50, flush_interval: float = 5.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer: dict[tuple[int, str], dict] = {}
+        self._last_flush = time.monotonic()
+
+    def final_outcomes(
+        self, gift_code: str, player_ids: list[int]
+    ) -> dict[int, RedeemOutcome]:
+        outcomes = {}
+        # Stay under SQLite's host parameter limit
+        for i in range(0, len(player_ids), 500):
+            query = RedemptionLedger.select(
+                RedemptionLedger.player_id, RedemptionLedger.result
+            ).where(
+                (RedemptionLedger.gift_code == gift_code)
+                & (RedemptionLedger.player_id.in_(player_ids[i : i + 500]))
+                & (
+                    RedemptionLedger.result.in_(
+                        [outcome.value for outcome in FINAL_OUTCOMES]
+                    )
+                )
+            )
+            for row in query:
+                outcomes[row.player_id] = RedeemOutcome(row.result)
+        return outcomes
+
+    def record(
+        self,
+        player_id: int,
+        gift_code: str,
+        outcome: RedeemOutcome,
+        err_code: int | None = None,
+    ):
+        self._buffer[(player_id, gift_code)] = {
+            "player_id": player_id,
+            "gift_code": gift_code,
+            "result": outcome.value,
+            "err_code": err_code,
+            "timestamp": timestamp(datetime.now(tz=timezone.utc)),
+        }
+        if (
+            len(self._buffer) >= self.batch_size
+            or time.monotonic() - self._last_flush >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self):
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return
+        rows = list(self._buffer.values())
+        self._buffer.clear()
+        with database.atomic():
+            for i in range(0, len(rows), 100):
+                RedemptionLedger.insert_many(
+                    rows[i : i + 100]
+                ).on_conflict_replace().execute()
@@ -0,0 +1,143 @@
+import bisect
+import os
+import threading
+from collections import defaultdict
+
+# Upper bounds in seconds, from cache hits to requests that hit the timeout
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15, 30)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense."""
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, p: float) -> float:
+        """Estimated like histogram_quantile, linearly inside the bucket."""
+        if not self.count:
+            return 0.0
+        rank = self.count * p / 100
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[index - 1] if index else 0.0
+                if index == len(self.buckets):
+                    # Above the last bound there's nothing to interpolate to
+                    return lower
+                upper = self.buckets[index]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+
+class RedemptionMetrics:
+    """
+    Process-wide counters and stage latency histograms of the redemption
+    path, rendered in the Prometheus text format.
+    """
+
+    def __init__(self, prefix: str = "wos_redeem"):
+        self.prefix = prefix
+        self.stage_seconds: dict[str, Histogram] = defaultdict(Histogram)
+        self.counters: dict[str, dict[tuple, float]] = defaultdict(
+            lambda: defaultdict(float)
+        )
+        self.help = {
+            "outcomes_total": "Final redemption outcomes",
+            "api_err_codes_total": "err_code values returned by the gift code API",
+            "errors_total": "Stage errors by type",
+            "retries_total": "Players sent through the pipeline again",
+            "captcha_refetches_total": "Low-confidence captchas replaced",
+            "captcha_too_frequent_total": "CAPTCHA GET TOO FREQUENT answers",
+            "circuit_transitions_total": "Circuit breaker state changes by endpoint",
+        }
+        self._lock = threading.Lock()
+
+    def observe_stage(self, stage: str, seconds: float):
+        self.stage_seconds[stage].observe(seconds)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        self.counters[name][tuple(sorted(labels.items()))] += value
+
+    def total(self, name: str) -> float:
+        return sum(self.counters[name].values())
+
+    def summary(self) -> dict:
+        return {
+            "stages": {
+                stage: {
+                    "count": histogram.count,
+                    "p50": histogram.percentile(50),
+                    "p95": histogram.percentile(95),
+                    "p99": histogram.percentile(99),
+                }
+                for stage, histogram in self.stage_seconds.items()
+            },
+            "counters": {
+                name: {
+                    ",".join(f"{key}={value}" for key, value in labels)
+                    or "total": count
+                    for labels, count in values.items()
+                }
+                for name, values in self.counters.items()
+            },
+        }
+
+    def render(self) -> str:
+        lines = []
+        name = f"{self.prefix}_stage_seconds"
+        lines.append(f"# HELP {name} Latency of each redemption pipeline stage")
+        lines.append(f"# TYPE {name} histogram")
+        for stage, histogram in self.stage_seconds.items():
+            cumulative = 0
+            for bound, bucket_count in zip(
+                list(histogram.buckets) + ["+Inf"], histogram.counts
+            ):
+                cumulative += bucket_count
+                labels = _labels((("stage", stage), ("le", bound)))
+                lines.append(f"{name}_bucket{labels} {cumulative}")
+            stage_label = _labels((("stage", stage),))
+            lines.append(f"{name}_sum{stage_label} {histogram.sum}")
+            lines.append(f"{name}_count{stage_label} {histogram.count}")
+
+        for counter, values in self.counters.items():
+            name = f"{self.prefix}_{counter}"
+            lines.append(f"# HELP {name} {self.help.get(counter, counter)}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in values.items():
+                lines.append(f"{name}{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str, text: str | None = None):
+        """
+        Writes atomically, so the node exporter never reads half a file. From
+        another thread, pass the `render()` output from the event loop, the
+        metrics aren't safe to read while they're updated.
+        """
+        if text is None:
+            text = self.render()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._lock:
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, "w") as f:
+                f.write(text)
+            os.replace(temp_path, path)
@@ -0,0 +1,102 @@
+import asyncio
+import time
+from typing import Callable
+
+import discord
+
+
+class ProgressReporter:
+    """
+    Coalesces progress edits of an interaction's message, or of a new message
+    in `channel` when there's no interaction (e.g. for resumed jobs).
+
+    `update` only remembers how to render the latest state, the message is
+    edited at most once every `interval` seconds and once more by `finish`.
+    Interaction webhooks stop working 15 minutes after the interaction was
+    created, so shortly before that the reporter moves on to a regular channel
+    message, which the bot can keep editing for as long as the run takes. The
+    same happens when the first edit only comes after that, e.g. for a job
+    that waited in the queue.
+    """
+
+    def __init__(
+        self,
+        interaction: discord.Interaction | None = None,
+        channel: discord.abc.Messageable | None = None,
+        interval: float = 5.0,
+        token_lifetime: float = 15 * 60,
+        expiry_margin: float = 60,
+    ):
+        self.interaction = interaction
+        self.channel = channel or (interaction.channel if interaction else None)
+        self.interval = interval
+        self.token_lifetime = token_lifetime
+        self.expiry_margin = expiry_margin
+
+        self.message: discord.Message | None = None
+        self.edits = 0
+        self._render: Callable[[], discord.Embed] | None = None
+        self._dirty = False
+        # The caller has just sent the initial message, give it one interval
+        self._last_flush = time.monotonic()
+        self._task: asyncio.Task | None = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def token_expiring(self) -> bool:
+        if self.interaction is None:
+            return False
+        age = (discord.utils.utcnow() - self.interaction.created_at).total_seconds()
+        return age >= self.token_lifetime - self.expiry_margin
+
+    def update(self, render: Callable[[], discord.Embed]):
+        self._render = render
+        self._dirty = True
+        if self._task is None or self._task.done():
+            delay = max(0.0, self.interval - (time.monotonic() - self._last_flush))
+            self._task = asyncio.create_task(self._flush_later(delay))
+
+    async def _flush_later(self, delay: float):
+        await asyncio.sleep(delay)
+        await self.flush()
+
+    async def flush(self, **kwargs):
+        async with self._lock:
+            if not self._dirty or self._render is None:
+                return
+            self._dirty = False
+            self._last_flush = time.monotonic()
+            try:
+                await self._edit(embed=self._render(), **kwargs)
+            except discord.HTTPException as e:
+                # A missed progress update isn't worth failing the run over
+                print(f"Failed to update progress message: {e}")
+
+    async def _edit(self, **kwargs):
+        if self.message is None:
+            if self.interaction is None or self.token_expiring:
+                # A queued job may only start once the token is already gone
+                if self.channel is None:
+                    return
+                self.message = await self.channel.send(**kwargs)
+                self.edits += 1
+                return
+            self.message = await self.interaction.original_response()
+
+        if (
+            isinstance(self.message, discord.InteractionMessage)
+            and self.token_expiring
+            and self.channel is not None
+        ):
+            await self.message.edit(content="⬇️ Continued in the message below.")
+            self.message = await self.channel.send(**kwargs)
+        else:
+            await self.message.edit(**kwargs)
+        self.edits += 1
+
+    async def finish(self, embed: discord.Embed, view: discord.ui.View | None = None):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        self._render = lambda: embed
+        self._dirty = True
+        await self.flush(view=view)
@@ -0,0 +1,1012 @@
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from collections import defaultdict, deque
+from enum import Enum
+from typing import Any, Callable, Optional
+
+from utils.captcha import CaptchaResultCache
+from utils.gift_codes import GiftCodeRedeemer
+from utils.inference import InferenceError
+from utils.metrics import RedemptionMetrics
+from utils.wos_api import PlayerSession
+
+
+class RedeemOutcome(Enum):
+    SUCCESS = "success"
+    ALREADY_REDEEMED = "already_redeemed"
+    RATE_LIMITED = "rate_limited"
+    INVALID_CODE = "invalid_code"
+    EXPIRED = "expired"
+    USAGE_LIMIT = "usage_limit"
+    CAPTCHA_ERROR = "captcha_error"
+    TIMEOUT = "timeout"
+    SERVER_ERROR = "server_error"
+    FAILED = "failed"
+
+
+# Stove info, captcha and submit for a player's first code, the stove info
+# request is skipped when the player's session is cached
+CALLS_PER_ACCOUNT = 3
+
+# Outcomes that apply to the gift code itself, so every other player would get
+# the same answer
+TERMINAL_OUTCOMES = (
+    RedeemOutcome.INVALID_CODE,
+    RedeemOutcome.EXPIRED,
+    RedeemOutcome.USAGE_LIMIT,
+)
+
+# Outcomes that are likely to go away if the same player is tried again later
+TRANSIENT_OUTCOMES = (
+    RedeemOutcome.RATE_LIMITED,
+    RedeemOutcome.CAPTCHA_ERROR,
+    RedeemOutcome.TIMEOUT,
+    RedeemOutcome.SERVER_ERROR,
+)
+
+
+def classify(err_code: int, msg: str) -> RedeemOutcome:
+    if err_code == 20000:
+        return RedeemOutcome.SUCCESS
+    if err_code == 40008:
+        return RedeemOutcome.ALREADY_REDEEMED
+    if err_code == 40014 or msg == "CDK NOT FOUND.":
+        return RedeemOutcome.INVALID_CODE
+    if err_code == 40007 or msg == "TIME ERROR.":
+        return RedeemOutcome.EXPIRED
+    if err_code == 40005 or msg == "USED.":
+        return RedeemOutcome.USAGE_LIMIT
+    if "TOO FREQUENT" in msg or msg.endswith("TOO_FREQUENT"):
+        return RedeemOutcome.RATE_LIMITED
+    if err_code == 40103 or msg == "CAPTCHA CHECK ERROR.":
+        return RedeemOutcome.CAPTCHA_ERROR
+    if err_code == 40004 or msg == "TIMEOUT RETRY." or "_EXCEPTION" in msg:
+        return RedeemOutcome.TIMEOUT
+    if msg in ("SERVER_ERROR", "CAPTCHA_FETCH_ERROR"):
+        return RedeemOutcome.SERVER_ERROR
+    return RedeemOutcome.FAILED
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter between retry rounds: before round
+    `n` the engine waits a random time between 0 and `base_delay * 2 ** (n - 1)`
+    seconds, capped at `max_delay`.
+    """
+
+    def __init__(
+        self, rounds: int = 3, base_delay: float = 5.0, max_delay: float = 60.0
+    ):
+        self.rounds = rounds
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, round_number: int) -> float:
+        return random.uniform(
+            0, min(self.max_delay, self.base_delay * 2 ** (round_number - 1))
+        )
+
+
+class TokenBucket:
+    """Allows `rate` requests per second on average, with bursts of `capacity`."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class FairScheduler:
+    """
+    Weighted fair queuing of requests from several flows (guilds) in front of
+    a shared `TokenBucket`.
+
+    Every request gets a virtual finish tag of
+    `max(virtual time, flow's last tag) + 1 / weight` and tokens are handed
+    out in tag order, so each flow with requests waiting gets a share of the
+    rate proportional to its weight, however many requests it has queued.
+    A flow that was idle starts at the current virtual time and can't claim
+    the share it didn't use.
+    """
+
+    def __init__(self, bucket: TokenBucket, weights: dict | None = None):
+        self.bucket = bucket
+        self.weights = weights or {}
+        self.virtual_time = 0.0
+        self.queued: defaultdict[Any, int] = defaultdict(int)
+        self.granted: defaultdict[Any, int] = defaultdict(int)
+        self._last_tag: dict[Any, float] = {}
+        self._heap: list[tuple[float, int, Any, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._dispatcher: asyncio.Task | None = None
+
+    def weight(self, flow) -> float:
+        return float(self.weights.get(str(flow), self.weights.get(flow, 1.0)))
+
+    def share(self, flow) -> float:
+        """Fraction of the rate `flow` gets while all queued flows stay busy."""
+        active = {queued_flow for queued_flow, n in self.queued.items() if n} | {flow}
+        return self.weight(flow) / sum(self.weight(other) for other in active)
+
+    async def acquire(self, flow=None):
+        start = max(self.virtual_time, self._last_tag.get(flow, 0.0))
+        tag = start + 1 / self.weight(flow)
+        self._last_tag[flow] = tag
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (tag, next(self._sequence), flow, future))
+
+        self.queued[flow] += 1
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        try:
+            await future
+        finally:
+            self.queued[flow] -= 1
+            if not self.queued[flow]:
+                del self.queued[flow]
+        self.granted[flow] += 1
+
+    async def _dispatch(self):
+        while self._heap:
+            await self.bucket.acquire()
+            while self._heap:
+                tag, _, flow, future = heapq.heappop(self._heap)
+                # Waiters cancelled with their job just drop out of the queue
+                if not future.done():
+                    self.virtual_time = tag
+                    future.set_result(None)
+                    break
+
+
+class CircuitState(Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for one API endpoint.
+
+    Closed, it tracks the last `window` calls and opens once at least
+    `min_calls` were made and `failure_threshold` of them failed. Open, calls
+    wait instead of failing - a run pauses without putting load on the
+    endpoint - until `open_timeout` has passed. Then it's half-open and lets
+    `probes` calls through: a success closes it again, a failure reopens it
+    with the timeout doubled, up to `max_open_timeout`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window: int = 20,
+        min_calls: int = 10,
+        failure_threshold: float = 0.5,
+        open_timeout: float = 15.0,
+        max_open_timeout: float = 300.0,
+        probes: int = 1,
+        on_change: Optional[Callable[["CircuitBreaker"], Any]] = None,
+    ):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_threshold = failure_threshold
+        self.base_timeout = open_timeout
+        self.open_timeout = open_timeout
+        self.max_open_timeout = max_open_timeout
+        self.probes = probes
+        self.on_change = on_change
+
+        self.state = CircuitState.CLOSED
+        self.results: deque[bool] = deque(maxlen=window)
+        self.opened_at = 0.0
+        self.probes_in_flight = 0
+        self._condition = asyncio.Condition()
+
+    @property
+    def failure_rate(self) -> float:
+        return self.results.count(False) / len(self.results) if self.results else 0.0
+
+    @property
+    def retry_in(self) -> float:
+        """Seconds until an open breaker lets probes through."""
+        if self.state != CircuitState.OPEN:
+            return 0.0
+        return max(0.0, self.opened_at + self.open_timeout - time.monotonic())
+
+    def _set_state(self, state: CircuitState):
+        self.state = state
+        if state == CircuitState.OPEN:
+            self.opened_at = time.monotonic()
+        elif state == CircuitState.CLOSED:
+            self.results.clear()
+            self.open_timeout = self.base_timeout
+        self._condition.notify_all()
+        print(f"Circuit breaker {self.name}: {state.value}")
+        if self.on_change:
+            self.on_change(self)
+
+    async def acquire(self) -> bool:
+        """Waits until a call may go out, returns whether it's a probe."""
+        async with self._condition:
+            while True:
+                if self.state == CircuitState.CLOSED:
+                    return False
+                if self.state == CircuitState.OPEN:
+                    if self.retry_in > 0:
+                        try:
+                            await asyncio.wait_for(
+                                self._condition.wait(), timeout=self.retry_in
+                            )
+                        except asyncio.TimeoutError:
+                            pass
+                        continue
+                    self._set_state(CircuitState.HALF_OPEN)
+                if self.probes_in_flight < self.probes:
+                    self.probes_in_flight += 1
+                    return True
+                await self._condition.wait()
+
+    async def release(self, probe: bool, success: bool | None):
+        """`success` is None when the call didn't finish, e.g. was cancelled."""
+        async with self._condition:
+            if probe:
+                self.probes_in_flight -= 1
+                if success is None:
+                    self._condition.notify_all()
+                elif success:
+                    self._set_state(CircuitState.CLOSED)
+                else:
+                    self.open_timeout = min(
+                        self.max_open_timeout, self.open_timeout * 2
+                    )
+                    self._set_state(CircuitState.OPEN)
+                return
+
+            if success is None or self.state != CircuitState.CLOSED:
+                # Stragglers from before the breaker opened don't count
+                return
+            self.results.append(success)
+            if (
+                len(self.results) >= self.min_calls
+                and self.failure_rate >= self.failure_threshold
+            ):
+                self._set_state(CircuitState.OPEN)
+
+
+def is_outage(msg: str) -> bool:
+    """Errors that say the endpoint is down rather than anything about the player."""
+    if msg == "CAPTCHA_FETCH_ERROR":
+        # Usually a stale login, the endpoint itself answered
+        return False
+    return classify(-1, msg) in (RedeemOutcome.SERVER_ERROR, RedeemOutcome.TIMEOUT)
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD concurrency limit: every clean response raises the limit by roughly
+    one per window of in-flight requests, every rate limit or error cuts it by
+    `decrease`. Cuts are applied at most once per `cooldown` seconds so one
+    burst of errors doesn't collapse the limit to the minimum.
+    """
+
+    def __init__(
+        self,
+        initial: int = 4,
+        minimum: int = 1,
+        maximum: int = 16,
+        decrease: float = 0.5,
+        cooldown: float = 2.0,
+    ):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, backoff: bool = False):
+        async with self._condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if backoff:
+                if now - self._last_decrease >= self.cooldown:
+                    self.limit = max(self.minimum, self.limit * self.decrease)
+                    self._last_decrease = now
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+class StageStats:
+    """Latency and throughput of one pipeline stage."""
+
+    def __init__(
+        self,
+        name: str,
+        queue: asyncio.Queue | None = None,
+        samples: int | None = 200,
+    ):
+        self.name = name
+        self.queue = queue
+        self.processed = 0
+        self.busy = 0
+        self.total_time = 0.0
+        # The most recent `samples` latencies, all of them with None
+        self.latencies: deque[float] = deque(maxlen=samples)
+
+    @property
+    def queue_depth(self) -> int:
+        return self.queue.qsize() if self.queue is not None else 0
+
+    @property
+    def average_latency(self) -> float:
+        return sum(self.latencies) / len(self.latencies) if self.latencies else 0.0
+
+    def percentile(self, p: float) -> float:
+        """Latency percentile over the most recent samples, in seconds."""
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+    def record(self, elapsed: float):
+        self.processed += 1
+        self.total_time += elapsed
+        self.latencies.append(elapsed)
+
+    def __str__(self):
+        return (
+            f"{self.name}: {self.queue_depth} queued, {self.busy} busy, "
+            f"{self.average_latency * 1000:.0f} ms avg"
+        )
+
+
+class RedemptionReport:
+    def __init__(self, code: str, total: int):
+        self.code = code
+        self.total = total
+        self.success: list[int] = []
+        self.already_redeemed: list[int] = []
+        self.fail: list[int] = []
+        # Players whose outcome was already known from the ledger
+        self.skipped_players: list[int] = []
+        # Set when the code turned out to be invalid, expired or used up
+        self.aborted: RedeemOutcome | None = None
+        # Players sent through the pipeline again after a transient failure
+        self.retries = 0
+        self.rounds = 0
+        # Low-confidence captchas replaced by a fresh one instead of submitted
+        self.captcha_refetches = 0
+        self.stages: dict[str, StageStats] = {}
+        self.started = time.monotonic()
+        self.finished: float | None = None
+
+    @property
+    def done(self) -> int:
+        return len(self.success) + len(self.already_redeemed) + len(self.fail)
+
+    @property
+    def skipped(self) -> int:
+        return len(self.skipped_players)
+
+    @property
+    def answered(self) -> list[int]:
+        """Players the API redeemed for in this run, or said already had."""
+        skipped = set(self.skipped_players)
+        return [
+            player_id
+            for player_id in self.success + self.already_redeemed
+            if player_id not in skipped
+        ]
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def accounts_per_minute(self) -> float:
+        return self.done / self.elapsed * 60 if self.elapsed else 0.0
+
+    @property
+    def stage_summary(self) -> str:
+        return "\n".join(str(stage) for stage in self.stages.values())
+
+    def add(self, player_id: int, outcome: RedeemOutcome):
+        if outcome == RedeemOutcome.SUCCESS:
+            self.success.append(player_id)
+        elif outcome == RedeemOutcome.ALREADY_REDEEMED:
+            self.already_redeemed.append(player_id)
+        else:
+            self.fail.append(player_id)
+
+
+class _Aborted(Exception):
+    """A call that wasn't sent, as its gift code's run was aborted meanwhile."""
+
+
+class _PlayerState:
+    """What the items of one player share within a run, across all codes."""
+
+    def __init__(self, reports: dict[str, "RedemptionReport"]):
+        # The run's reports by code
+        self.reports = reports
+        # Pending or finished stove info call, reused by every code
+        self.login: asyncio.Future | None = None
+        # Held from captcha fetch until submit, a new captcha replaces the last
+        self.lock = asyncio.Lock()
+
+
+class _Redemption:
+    """A (player, code) pair travelling through the pipeline."""
+
+    def __init__(self, player_id: int, code: str, state: _PlayerState, flow=None):
+        self.player_id = player_id
+        self.code = code
+        self.state = state
+        self.flow = flow
+        self.player: PlayerSession | None = None
+        self.image: bytes | None = None
+        self.captcha: str | None = None
+        self.err_code: int | None = None
+        self.refetches = 0
+        self.captcha_key: bytes | None = None
+        self.holds_lock = False
+
+    @property
+    def aborted(self) -> bool:
+        return self.state.reports[self.code].aborted is not None
+
+    def release(self):
+        if self.holds_lock:
+            self.holds_lock = False
+            self.state.lock.release()
+
+
+class RedemptionEngine:
+    """
+    Redeems one gift code for many players as a staged pipeline:
+
+        stove info -> captcha fetch -> captcha solve -> submit
+
+    Stages are connected by bounded queues, so while one player's code is
+    being submitted the next player's captcha is solved and the one after
+    that has its stove info fetched. Every API call is paced by a token
+    bucket, shared fairly between the guilds running at the same time, and
+    the number of calls in flight follows an AIMD limit that backs off on
+    rate limits and error codes.
+
+    Before fanning out, up to `preflight_canaries` players redeem the code one
+    by one. If the API says the code is invalid, expired or used up the run
+    stops right there, and the same answer seen by any worker later on stops
+    the remaining work as well.
+
+    Players that fail for transient reasons (rate limits, wrong captchas,
+    timeouts, server errors) are sent through the pipeline again in up to
+    `retry_rounds` more rounds, each after a jittered exponential backoff.
+    Captchas decoded with a confidence below `min_confidence` are re-fetched
+    (up to `max_refetches` times) rather than submitted. With a
+    `CaptchaResultCache`, images the server already accepted an answer for
+    skip inference altogether.
+
+    `run_codes` redeems several codes in the same pass, logging every player
+    in only once; `run` is the single code case.
+
+    Each endpoint has a `CircuitBreaker`: when most recent calls to it fail
+    with server errors or timeouts, calls pause until probe requests show it
+    has recovered, instead of every player failing slowly.
+
+    With a `Ledger`, players that already have a final outcome for the code
+    are counted without touching the network and every new outcome is
+    recorded, so an interrupted run picks up where it stopped.
+    """
+
+    def __init__(
+        self,
+        redeemer: GiftCodeRedeemer,
+        rate: float = 5.0,
+        burst: int = 5,
+        initial_concurrency: int = 4,
+        max_concurrency: int = 16,
+        queue_size: int = 8,
+        solve_workers: int = 4,
+        preflight_canaries: int = 2,
+        retry_rounds: int = 3,
+        retry_base_delay: float = 5.0,
+        retry_max_delay: float = 60.0,
+        min_confidence: float = 0.5,
+        max_refetches: int = 2,
+        captcha_cache: CaptchaResultCache | None = None,
+        ledger=None,
+        guild_weights: dict | None = None,
+        metrics: RedemptionMetrics | None = None,
+        circuit_breaker: dict | None = None,
+        latency_samples: int | None = 200,
+    ):
+        self.redeemer = redeemer
+        self.latency_samples = latency_samples
+        self.metrics = metrics or RedemptionMetrics()
+        self.breakers = {
+            endpoint: CircuitBreaker(
+                endpoint, on_change=self._on_circuit_change, **(circuit_breaker or {})
+            )
+            for endpoint in ("player", "captcha", "gift_code")
+        }
+        self.ledger = ledger
+        self.bucket = TokenBucket(rate, burst)
+        self.scheduler = FairScheduler(self.bucket, guild_weights)
+        # Calls waiting for their turn, with what tells if they're still needed
+        self._waiting: dict[asyncio.Future, Callable[[], bool]] = {}
+        self._dropped: set[asyncio.Future] = set()
+        # Reports of the runs in progress, by flow
+        self.active: defaultdict[Any, list[RedemptionReport]] = defaultdict(list)
+        self.concurrency = AdaptiveConcurrency(
+            initial=initial_concurrency, maximum=max_concurrency
+        )
+        self.queue_size = queue_size
+        self.solve_workers = solve_workers
+        self.preflight_canaries = preflight_canaries
+        self.retry_policy = RetryPolicy(retry_rounds, retry_base_delay, retry_max_delay)
+        self.min_confidence = min_confidence
+        self.max_refetches = max_refetches
+        self.captcha_cache = captcha_cache
+
+    async def _api_call(
+        self,
+        endpoint: str,
+        call,
+        is_clean: Callable[[Any], bool],
+        error: Callable[[Any], Optional[str]],
+        flow=None,
+        aborted: Callable[[], bool] = lambda: False,
+    ):
+        """Raises `_Aborted` instead of calling once `aborted()` turns true."""
+        breaker = self.breakers[endpoint]
+        # While the endpoint is down, wait here without spending rate tokens
+        probe = await breaker.acquire()
+        success = None
+        try:
+            # Wait for the flow's turn first, so a big run's queued requests
+            # don't hold every concurrency slot while a small run waits
+            turn = asyncio.ensure_future(self.scheduler.acquire(flow))
+            self._waiting[turn] = aborted
+            try:
+                await turn
+            except asyncio.CancelledError:
+                if turn in self._dropped:
+                    raise _Aborted()
+                raise
+            finally:
+                self._waiting.pop(turn, None)
+                self._dropped.discard(turn)
+            await self.concurrency.acquire()
+            clean = False
+            try:
+                # The wait may have been long, don't send what's no longer needed
+                if aborted():
+                    clean = True
+                    raise _Aborted()
+                result = await call()
+                clean = is_clean(result)
+            finally:
+                await self.concurrency.release(backoff=not clean)
+            success = not is_outage(error(result) or "")
+            return result
+        finally:
+            await breaker.release(probe, success)
+
+    def _drop_aborted(self):
+        """Takes the calls of aborted runs out of the rate limit queue."""
+        for turn, aborted in list(self._waiting.items()):
+            if aborted() and not turn.done():
+                self._dropped.add(turn)
+                turn.cancel()
+
+    @property
+    def open_circuits(self) -> list[CircuitBreaker]:
+        return [
+            breaker
+            for breaker in self.breakers.values()
+            if breaker.state != CircuitState.CLOSED
+        ]
+
+    def _on_circuit_change(self, breaker: CircuitBreaker):
+        self.metrics.inc(
+            "circuit_transitions_total",
+            endpoint=breaker.name,
+            state=breaker.state.value,
+        )
+
+    async def _fetch_stove_info(self, item: _Redemption):
+        if item.player is not None:
+            # Retried after a wrong captcha, the login is still good
+            return None
+        login = item.state.login
+        if login is None or (
+            login.done()
+            and (
+                login.cancelled()
+                or login.exception() is not None
+                or login.result()[1] is not None
+            )
+        ):
+            # First code for this player, or the last attempt failed. Cache
+            # hits cost no request, so they don't wait for a rate token
+            cached = self.redeemer.cached_stove_info(item.player_id)
+            if cached is not None:
+                login = item.state.login = asyncio.get_running_loop().create_future()
+                login.set_result((cached, None))
+                item.player = cached
+                return None
+            login = item.state.login = asyncio.ensure_future(
+                self._api_call(
+                    "player",
+                    # Only requests that reach the API count for the breaker
+                    lambda: self.redeemer.get_stove_info(
+                        item.player_id, use_cache=False
+                    ),
+                    lambda result: result[1] is None,
+                    lambda result: result[1],
+                    item.flow,
+                    # Shared by all codes, only needed while one of them runs
+                    lambda: all(
+                        report.aborted for report in item.state.reports.values()
+                    ),
+                )
+            )
+        item.player, err = await asyncio.shield(login)
+        return err
+
+    async def _fetch_captcha(self, item: _Redemption):
+        if not item.holds_lock:
+            await item.state.lock.acquire()
+            item.holds_lock = True
+        item.image, err = await self._api_call(
+            "captcha",
+            lambda: self.redeemer.fetch_captcha(item.player),
+            lambda result: result[1] is None,
+            lambda result: result[1],
+            item.flow,
+            lambda: item.aborted,
+        )
+        return err
+
+    async def _solve(self, item: _Redemption):
+        if self.captcha_cache is not None:
+            item.captcha_key = self.captcha_cache.key(item.image)
+            cached = self.captcha_cache.get(item.captcha_key)
+            if cached is not None:
+                item.captcha = cached
+                return None
+
+        try:
+            solution = await self.redeemer.solve(item.image)
+        except (ConnectionError, InferenceError) as e:
+            # Remote solver or inference workers down, worth another round
+            return f"SOLVER_EXCEPTION: {e}"
+        # A doubtful decode would most likely cost a failed submit, a fresh
+        # captcha is cheaper
+        while (
+            solution.confidence < self.min_confidence
+            and item.refetches < self.max_refetches
+        ):
+            item.refetches += 1
+            err = await self._fetch_captcha(item)
+            if err:
+                return err
+            if self.captcha_cache is not None:
+                item.captcha_key = self.captcha_cache.key(item.image)
+            try:
+                solution = await self.redeemer.solve(item.image)
+            except (ConnectionError, InferenceError) as e:
+                return f"SOLVER_EXCEPTION: {e}"
+        item.captcha = solution.text
+
+    async def _submit(self, item: _Redemption):
+        try:
+            err_code, msg = await self._api_call(
+                "gift_code",
+                lambda: self.redeemer.submit(item.player, item.code, item.captcha),
+                lambda result: classify(*result)
+                in (RedeemOutcome.SUCCESS, RedeemOutcome.ALREADY_REDEEMED),
+                lambda result: result[1],
+                item.flow,
+                lambda: item.aborted,
+            )
+        finally:
+            # The captcha is used up, the player's next code may fetch one
+            item.release()
+        item.err_code = err_code
+        self.metrics.inc("api_err_codes_total", err_code=err_code)
+        outcome = classify(err_code, msg)
+
+        if self.captcha_cache is not None and item.captcha_key is not None:
+            if outcome == RedeemOutcome.SUCCESS:
+                self.captcha_cache.put(item.captcha_key, item.captcha)
+            elif outcome == RedeemOutcome.CAPTCHA_ERROR:
+                self.captcha_cache.discard(item.captcha_key)
+        return outcome
+
+    async def run(
+        self,
+        player_ids: list[int],
+        code: str,
+        on_result: Optional[Callable[[RedemptionReport], Any]] = None,
+        on_outcome: Optional[
+            Callable[[int, str, RedeemOutcome, Optional[int]], Any]
+        ] = None,
+        flow=None,
+    ) -> RedemptionReport:
+        """Redeems a single code, see `run_codes`."""
+        reports = await self.run_codes(
+            player_ids, [code], on_result, on_outcome, flow=flow
+        )
+        return reports[code]
+
+    def flow_stats(self, flow) -> dict:
+        """
+        Queue depth and expected time to completion of a flow's active runs.
+        The ETA follows the runs' throughput so far, or the flow's fair share
+        of the rate before the first results are in.
+        """
+        reports = self.active.get(flow, [])
+        remaining = sum(
+            0 if report.aborted else report.total - report.done for report in reports
+        )
+        share = self.scheduler.share(flow)
+        processed = sum(report.done - report.skipped for report in reports)
+        elapsed = max((report.elapsed for report in reports), default=0.0)
+        if processed and elapsed:
+            eta = remaining / (processed / elapsed)
+        else:
+            calls = CALLS_PER_ACCOUNT - self.redeemer.stove_cache_hit_ratio
+            eta = remaining * calls / (self.bucket.rate * share)
+        return {
+            "runs": len(reports),
+            "queued_requests": self.scheduler.queued.get(flow, 0),
+            "remaining": remaining,
+            "share": share,
+            "eta": eta if remaining else 0.0,
+        }
+
+    async def run_codes(
+        self,
+        player_ids: list[int],
+        codes: list[str],
+        on_result: Optional[Callable[[RedemptionReport], Any]] = None,
+        on_outcome: Optional[
+            Callable[[int, str, RedeemOutcome, Optional[int]], Any]
+        ] = None,
+        flow=None,
+    ) -> dict[str, RedemptionReport]:
+        """
+        Redeems several codes for the same players in one pass, with one report
+        per code. Each player's stove info is fetched once and shared by all
+        codes, so every further code only costs a captcha and a submit.
+
+        `on_result` gets the code's report after every final outcome,
+        `on_outcome` the player ID, code, outcome and API error code (None for
+        players skipped through the ledger). Both may be coroutine functions.
+
+        Runs with different `flow`s (guild IDs) share the API rate through the
+        engine's `FairScheduler`.
+        """
+
+        async def notify(callback, *args):
+            if callback:
+                result = callback(*args)
+                if asyncio.iscoroutine(result):
+                    await result
+
+        stages = [
+            ("stove info", self._fetch_stove_info, "network"),
+            ("captcha fetch", self._fetch_captcha, "network"),
+            ("captcha solve", self._solve, "solve"),
+            ("submit", self._submit, "network"),
+        ]
+        # Stages are shared by all codes, so are their stats
+        stage_stats = {
+            name: StageStats(name, samples=self.latency_samples)
+            for name, _, _ in stages
+        }
+        reports: dict[str, RedemptionReport] = {}
+        states = {player_id: _PlayerState(reports) for player_id in player_ids}
+        # Code by code, so the same player rarely waits for its own captcha lock
+        items: list[_Redemption] = []
+
+        for code in dict.fromkeys(codes):
+            report = RedemptionReport(code, len(player_ids))
+            report.stages = stage_stats
+            reports[code] = report
+
+            pending = player_ids
+            if self.ledger is not None:
+                known = self.ledger.final_outcomes(code, player_ids)
+                for player_id, outcome in known.items():
+                    report.add(player_id, outcome)
+                    await notify(on_outcome, player_id, code, outcome, None)
+                report.skipped_players = list(known)
+                pending = [
+                    player_id for player_id in player_ids if player_id not in known
+                ]
+            items += [
+                _Redemption(player_id, code, states[player_id], flow)
+                for player_id in pending
+            ]
+
+        retry_items: list[_Redemption] = []
+        rounds = 0
+
+        async def finish(item: _Redemption, outcome: RedeemOutcome):
+            item.release()
+            report = reports[item.code]
+            report.captcha_refetches += item.refetches
+            if item.refetches:
+                self.metrics.inc("captcha_refetches_total", item.refetches)
+            if outcome in TRANSIENT_OUTCOMES and rounds < self.retry_policy.rounds:
+                # A fresh captcha is needed either way, the login only on errors
+                # that might have come from it (a stale session shows up as
+                # CAPTCHA_FETCH_ERROR, a server error)
+                retry = _Redemption(item.player_id, item.code, item.state, flow)
+                if outcome not in (RedeemOutcome.SERVER_ERROR, RedeemOutcome.TIMEOUT):
+                    retry.player = item.player
+                elif item.state.login is not None and item.state.login.done():
+                    item.state.login = None
+                retry_items.append(retry)
+                return
+
+            report.add(item.player_id, outcome)
+            self.metrics.inc("outcomes_total", outcome=outcome.value)
+            if outcome in TERMINAL_OUTCOMES and report.aborted is None:
+                report.aborted = outcome
+                self._drop_aborted()
+            if self.ledger is not None:
+                self.ledger.record(item.player_id, item.code, outcome, item.err_code)
+            await notify(on_outcome, item.player_id, item.code, outcome, item.err_code)
+            await notify(on_result, report)
+
+        async def process(index: int, item: _Redemption) -> RedeemOutcome | None:
+            """Runs one stage for an item, returns its outcome if it's done."""
+            name, handler, _ = stages[index]
+            stats = stage_stats[name]
+            stats.busy += 1
+            started = time.perf_counter()
+            try:
+                result = await handler(item)
+            except _Aborted:
+                result = None
+            except Exception as e:
+                print(f"Error in {name} for {item.player_id}: {e}")
+                self.metrics.inc("errors_total", stage=name, error=type(e).__name__)
+                result = RedeemOutcome.FAILED
+            finally:
+                stats.busy -= 1
+            elapsed = time.perf_counter() - started
+            stats.record(elapsed)
+            self.metrics.observe_stage(name, elapsed)
+
+            if isinstance(result, str):
+                # Drop exception details, they'd make a label per message
+                error = result.split(":", 1)[0]
+                self.metrics.inc("errors_total", stage=name, error=error)
+                if error == "CAPTCHA_TOO_FREQUENT":
+                    self.metrics.inc("captcha_too_frequent_total")
+                return classify(-1, result)
+            return result
+
+        async def pipeline(items: list[_Redemption]):
+            network_workers = min(self.concurrency.maximum, len(items))
+            workers = {"network": network_workers, "solve": self.solve_workers}
+            queues = [asyncio.Queue()] + [
+                asyncio.Queue(self.queue_size) for _ in range(len(stages) - 1)
+            ]
+            for (name, _, _), queue in zip(stages, queues):
+                stage_stats[name].queue = queue
+
+            async def stage(index: int):
+                source = queues[index]
+                outbox = queues[index + 1] if index + 1 < len(queues) else None
+
+                async def work():
+                    while (item := await source.get()) is not None:
+                        if item.aborted:
+                            item.release()
+                            continue
+                        outcome = await process(index, item)
+                        if outcome is None and item.aborted:
+                            item.release()
+                        elif outcome is not None:
+                            await finish(item, outcome)
+                        elif outbox is not None:
+                            await outbox.put(item)
+
+                await asyncio.gather(
+                    *(work() for _ in range(workers[stages[index][2]]))
+                )
+                # Let the next stage's workers know there's nothing more coming
+                if outbox is not None:
+                    for _ in range(workers[stages[index + 1][2]]):
+                        await outbox.put(None)
+
+            for item in items:
+                queues[0].put_nowait(item)
+            for _ in range(workers[stages[0][2]]):
+                queues[0].put_nowait(None)
+            await asyncio.gather(*(stage(index) for index in range(len(stages))))
+
+        self.active[flow] += reports.values()
+        try:
+            # Preflight: check each code on a few canaries before the whole roster
+            for code in reports:
+                for _ in range(self.preflight_canaries):
+                    item = next((item for item in items if item.code == code), None)
+                    if item is None:
+                        break
+                    items.remove(item)
+                    for index in range(len(stages)):
+                        outcome = await process(index, item)
+                        if outcome is not None:
+                            break
+                    await finish(item, outcome)
+                    if outcome in TERMINAL_OUTCOMES or outcome in (
+                        RedeemOutcome.SUCCESS,
+                        RedeemOutcome.ALREADY_REDEEMED,
+                    ):
+                        break
+
+            while True:
+                items = [
+                    item
+                    for item in items + retry_items
+                    if not reports[item.code].aborted
+                ]
+                retry_items.clear()
+                if not items:
+                    break
+                if rounds:
+                    for item in items:
+                        reports[item.code].retries += 1
+                    self.metrics.inc("retries_total", len(items))
+                    await asyncio.sleep(self.retry_policy.delay(rounds))
+                await pipeline(items)
+                items = []
+                rounds += 1
+                for report in reports.values():
+                    report.rounds = rounds
+        finally:
+            for report in reports.values():
+                self.active[flow].remove(report)
+            if not self.active[flow]:
+                del self.active[flow]
+            if self.ledger is not None:
+                self.ledger.flush()
+            self.redeemer.flush_stove_cache()
+
+        finished = time.monotonic()
+        for report in reports.values():
+            report.finished = finished
+        return reports
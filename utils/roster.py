@@ -0,0 +1,212 @@
+import csv
+import io
+import json
+import os
+import re
+from datetime import datetime, timezone
+
+from peewee import EXCLUDED, fn
+
+from orms.redemptions import RosterPlayer, RosterTag, database
+from utils.utils import timestamp
+
+# Keeps every insert_many under SQLite's host parameter limit
+CHUNK_SIZE = 100
+
+
+def _active(value) -> int | None:
+    if value is None or isinstance(value, bool):
+        return None if value is None else int(value)
+    normalized = str(value).strip().lower()
+    if normalized in ("1", "true", "yes", "y"):
+        return 1
+    if normalized in ("0", "false", "no", "n"):
+        return 0
+    raise ValueError(f"invalid active value {value!r}")
+
+
+def _tags(value) -> list[str]:
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = re.split(r"[,;|]", value)
+    return [tag.strip().lower() for tag in value if tag and tag.strip()]
+
+
+def parse_jsonc(text: str) -> list[dict]:
+    """
+    Reads the commented ids.jsonc layout: a `// R5, R4` line on its own tags
+    the players below it, a comment after an ID is the player's name.
+    """
+    players = []
+    section: list[str] = []
+    for line in text.splitlines():
+        value, _, comment = line.partition("//")
+        value = value.strip().strip(",[]").strip()
+        comment = comment.strip()
+        if not value:
+            if comment:
+                section = _tags(comment)
+            continue
+        players.append(
+            {"fid": int(value), "name": comment or None, "tags": list(section)}
+        )
+    return players
+
+
+def parse_roster(text: str, extension: str) -> list[dict]:
+    """
+    Returns the players in the contents of a .json, .jsonc or .csv roster.
+
+    JSON may be a list of IDs or of objects with `fid` and optionally
+    `guild_id`, `name`, `tags` and `active`; CSV files use the same column
+    names, with tags separated by ";".
+    """
+    extension = extension.lower().lstrip(".")
+    if extension == "jsonc":
+        return parse_jsonc(text)
+    if extension == "csv":
+        return [
+            {key: value or None for key, value in row.items()}
+            for row in csv.DictReader(io.StringIO(text))
+        ]
+    data = json.loads(text)
+    return [entry if isinstance(entry, dict) else {"fid": entry} for entry in data]
+
+
+def load_roster_file(path: str) -> list[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return parse_roster(f.read(), os.path.splitext(path)[1])
+
+
+def import_players(
+    players: list[dict], guild_id: int | None = None, replace_tags=False
+) -> tuple[int, int]:
+    """
+    Adds or merges players in one transaction, returns `(added, updated)`.
+
+    Values missing from an entry keep what the roster already has, so a bare
+    list of IDs doesn't wipe names or tags. Tags are added to the existing
+    ones, or replace them with `replace_tags`.
+    """
+    now = timestamp(datetime.now(tz=timezone.utc))
+    rows = {}
+    tags = {}
+    for player in players:
+        fid = int(player["fid"])
+        rows[fid] = {
+            "fid": fid,
+            "guild_id": int(player.get("guild_id") or guild_id or 0) or None,
+            "name": player.get("name"),
+            "is_active": _active(player.get("active")),
+            "added_at": now,
+        }
+        if player.get("tags") is not None:
+            tags[fid] = _tags(player["tags"])
+
+    fids = list(rows)
+    with database.atomic():
+        existing = set()
+        for i in range(0, len(fids), 500):
+            existing.update(
+                row.fid
+                for row in RosterPlayer.select(RosterPlayer.fid).where(
+                    RosterPlayer.fid.in_(fids[i : i + 500])
+                )
+            )
+
+        # The active flag only changes when the entry says so
+        for explicit in (True, False):
+            batch = [
+                {**row, "is_active": row["is_active"] if explicit else 1}
+                for row in rows.values()
+                if (row["is_active"] is not None) == explicit
+            ]
+            update = {
+                RosterPlayer.guild_id: fn.COALESCE(
+                    EXCLUDED.guild_id, RosterPlayer.guild_id
+                ),
+                RosterPlayer.name: fn.COALESCE(EXCLUDED.name, RosterPlayer.name),
+            }
+            if explicit:
+                update[RosterPlayer.is_active] = EXCLUDED.is_active
+            for i in range(0, len(batch), CHUNK_SIZE):
+                RosterPlayer.insert_many(batch[i : i + CHUNK_SIZE]).on_conflict(
+                    conflict_target=[RosterPlayer.fid], update=update
+                ).execute()
+
+        if replace_tags:
+            tagged = list(tags)
+            for i in range(0, len(tagged), 500):
+                RosterTag.delete().where(
+                    RosterTag.fid.in_(tagged[i : i + 500])
+                ).execute()
+        tag_rows = [
+            {"fid": fid, "tag": tag}
+            for fid, player_tags in tags.items()
+            for tag in player_tags
+        ]
+        for i in range(0, len(tag_rows), CHUNK_SIZE):
+            RosterTag.insert_many(
+                tag_rows[i : i + CHUNK_SIZE]
+            ).on_conflict_ignore().execute()
+
+    return len(rows) - len(existing), len(existing)
+
+
+def select_players(
+    guild_id: int | None = None,
+    tags: list[str] | None = None,
+    active_only=True,
+    seen_since: int | None = None,
+    limit: int | None = None,
+) -> list[int]:
+    """
+    Player IDs matching every given filter, ordered by ID. Players without a
+    guild belong to every guild; `tags` matches players with any of them.
+    """
+    query = RosterPlayer.select(RosterPlayer.fid)
+    if guild_id is not None:
+        query = query.where(
+            (RosterPlayer.guild_id == guild_id) | (RosterPlayer.guild_id.is_null())
+        )
+    if tags:
+        query = query.where(
+            RosterPlayer.fid.in_(
+                RosterTag.select(RosterTag.fid).where(RosterTag.tag.in_(_tags(tags)))
+            )
+        )
+    if active_only:
+        query = query.where(RosterPlayer.is_active == 1)
+    if seen_since is not None:
+        query = query.where(RosterPlayer.last_seen >= seen_since)
+    query = query.order_by(RosterPlayer.fid)
+    if limit:
+        query = query.limit(limit)
+    return [row.fid for row in query]
+
+
+def mark_seen(fids: list[int]):
+    """Stamps `last_seen` on players the API just answered for."""
+    now = timestamp(datetime.now(tz=timezone.utc))
+    with database.atomic():
+        for i in range(0, len(fids), 500):
+            RosterPlayer.update(last_seen=now).where(
+                RosterPlayer.fid.in_(fids[i : i + 500])
+            ).execute()
+
+
+def tag_counts(guild_id: int | None = None) -> dict[str, int]:
+    """Active players per tag."""
+    query = (
+        RosterTag.select(RosterTag.tag, fn.COUNT(RosterTag.fid).alias("players"))
+        .join(RosterPlayer, on=(RosterTag.fid == RosterPlayer.fid))
+        .where(RosterPlayer.is_active == 1)
+        .group_by(RosterTag.tag)
+        .order_by(RosterTag.tag)
+    )
+    if guild_id is not None:
+        query = query.where(
+            (RosterPlayer.guild_id == guild_id) | (RosterPlayer.guild_id.is_null())
+        )
+    return {row.tag: row.players for row in query}
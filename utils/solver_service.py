@@ -0,0 +1,207 @@
+"""
+Local captcha solving service, so several bot instances share one model.
+
+Run it next to the bots (from the repository root):
+    python -m utils.solver_service
+
+It listens on the Unix socket or host/port of the "captcha_service" section
+of config.json. Bots with "enabled" set in that section send their captchas
+to it through `RemoteCaptchaSolver` instead of loading the model themselves.
+
+    POST /solve    raw image bytes -> {"text", "char_confidences"}
+    GET  /health   model, batcher and latency stats
+"""
+
+import asyncio
+import json
+import time
+from collections import deque
+
+import aiohttp
+from aiohttp import web
+
+from utils.captcha import CaptchaBatcher, CaptchaSolution, captcha_models
+from utils.inference import InferenceExecutor
+
+
+class LatencyStats:
+    """Percentiles over the most recent `window` samples, in milliseconds."""
+
+    def __init__(self, window: int = 1000):
+        self.samples: deque[float] = deque(maxlen=window)
+        self.count = 0
+
+    def record(self, seconds: float):
+        self.samples.append(seconds * 1000)
+        self.count += 1
+
+    def percentile(self, p: float) -> float | None:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+        }
+
+
+class CaptchaService:
+    """
+    aiohttp app around a `CaptchaBatcher`, so requests from every connected
+    bot are batched together.
+    """
+
+    def __init__(self, executor: InferenceExecutor, **batcher_options):
+        self.executor = executor
+        self.batcher = CaptchaBatcher(executor, **batcher_options)
+        self.latency = LatencyStats()
+        self.errors = 0
+        self.started_at = time.time()
+        self.ready = False
+        self.last_error: str | None = None
+
+        self.app = web.Application()
+        self.app.router.add_post("/solve", self.handle_solve)
+        self.app.router.add_get("/health", self.handle_health)
+        self.app.on_startup.append(self.on_startup)
+        self.app.on_cleanup.append(self.on_cleanup)
+
+    async def on_startup(self, app: web.Application):
+        asyncio.create_task(self.warmup())
+
+    async def on_cleanup(self, app: web.Application):
+        self.executor.shutdown()
+
+    async def warmup(self):
+        try:
+            await self.executor.warmup()
+            self.ready = True
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"Captcha model failed to load: {e}")
+
+    async def handle_solve(self, request: web.Request) -> web.Response:
+        image_bytes = await request.read()
+        if not image_bytes:
+            return web.json_response({"error": "empty body"}, status=400)
+
+        started = time.perf_counter()
+        try:
+            solution = await self.batcher.solve(image_bytes)
+        except Exception as e:
+            self.errors += 1
+            print(f"Error solving captcha: {e}")
+            return web.json_response({"error": str(e)}, status=500)
+        self.latency.record(time.perf_counter() - started)
+
+        return web.json_response(
+            {
+                "text": solution.text,
+                "char_confidences": list(solution.char_confidences),
+            }
+        )
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        health = {
+            "ready": self.ready,
+            "last_error": self.last_error,
+            "uptime": time.time() - self.started_at,
+            "executor": {"mode": self.executor.mode, "workers": self.executor.workers},
+            "batcher": {
+                "batches": self.batcher.batches,
+                "items": self.batcher.items,
+                "batch_size": self.batcher.batch_size,
+                "queue_depth": self.batcher.queue_depth,
+            },
+            "latency": self.latency.summary(),
+            "errors": self.errors,
+        }
+        if self.executor.mode != "process":
+            # Process workers hold their own sessions, this one stays unloaded
+            health["model"] = captcha_models.health()
+        return web.json_response(health, status=200 if self.ready else 503)
+
+
+class RemoteCaptchaSolver:
+    """
+    Drop-in for `CaptchaBatcher` in `GiftCodeRedeemer` that solves captchas
+    through a running `CaptchaService`.
+
+    Raises `ConnectionError` when the service can't be reached or fails, so
+    the redemption engine can retry the player later.
+    """
+
+    def __init__(
+        self,
+        url: str = "http://127.0.0.1:8765",
+        socket_path: str | None = None,
+        timeout: float = 10.0,
+    ):
+        # Over a Unix socket the host part of the URL is ignored
+        self.url = "http://localhost" if socket_path else url.rstrip("/")
+        self.socket_path = socket_path
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self._session: aiohttp.ClientSession | None = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = (
+                aiohttp.UnixConnector(path=self.socket_path)
+                if self.socket_path
+                else aiohttp.TCPConnector()
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=self.timeout
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def solve(self, image_bytes: bytes) -> CaptchaSolution:
+        try:
+            async with self._get_session().post(
+                f"{self.url}/solve", data=image_bytes
+            ) as response:
+                payload = await response.json(content_type=None)
+                status = response.status
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            raise ConnectionError(f"Captcha service unavailable: {e}") from e
+
+        if status != 200:
+            raise ConnectionError(f"Captcha service error {status}: {payload}")
+        return CaptchaSolution(payload["text"], tuple(payload["char_confidences"]))
+
+    async def health(self) -> dict:
+        async with self._get_session().get(f"{self.url}/health") as response:
+            return await response.json(content_type=None)
+
+
+def main():
+    with open("config.json", "r") as f:
+        config = json.load(f)
+    captcha_models.configure(**config.get("captcha_model", {}))
+    service_config = config.get("captcha_service", {})
+
+    service = CaptchaService(
+        InferenceExecutor(**config.get("inference", {})),
+        **service_config.get("batcher", {}),
+    )
+    if service_config.get("socket_path"):
+        web.run_app(service.app, path=service_config["socket_path"])
+    else:
+        web.run_app(
+            service.app,
+            host=service_config.get("host", "127.0.0.1"),
+            port=service_config.get("port", 8765),
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+from collections import OrderedDict
+from datetime import datetime
+import hashlib
+import json
+import time
+
+import aiohttp
+
+from orms.redemptions import StoveInfo, database
+
+# WOS API URLs and Key
+wos_api_url = "https://wos-giftcode-api.centurygame.com/api"
+wos_player_info_url = f"{wos_api_url}/player"
+wos_giftcode_url = f"{wos_api_url}/gift_code"
+wos_captcha_url = f"{wos_api_url}/captcha"
+wos_giftcode_redemption_url = "https://wos-giftcode.centurygame.com"
+wos_encrypt_key = "tB87#kPtkxqOS2"
+
+HEADERS = {
+    "accept": "application/json, text/plain, */*",
+    "content-type": "application/x-www-form-urlencoded",
+    "origin": wos_giftcode_redemption_url,
+}
+
+
+def encode_data(data, debug_sign_error=False):
+    secret = wos_encrypt_key
+    sorted_keys = sorted(data.keys())
+    encoded_data = "&".join(
+        [
+            f"{key}={json.dumps(data[key]) if isinstance(data[key], dict) else data[key]}"
+            for key in sorted_keys
+        ]
+    )
+    sign = hashlib.md5(f"{encoded_data}{secret}".encode()).hexdigest()
+
+    return {"sign": sign, **data}
+
+
+class PlayerSession:
+    """
+    Login state of a single player: the stove info payload and the cookies the
+    API set for it. Captcha and gift code requests must carry those cookies.
+    """
+
+    def __init__(self, fid: int, stove_info: dict, cookies: dict):
+        self.fid = fid
+        self.stove_info = stove_info
+        self.cookies = cookies
+
+
+class StoveInfoCache:
+    """
+    TTL + LRU cache of player sessions keyed by fid, so repeated redemptions
+    can skip the stove info request. With `persist` the entries are also kept
+    in SQLite and survive restarts: the fresh ones are loaded once, on first
+    use, and changes are buffered and written in one transaction every
+    `batch_size` changes or `flush_interval` seconds, like the ledger.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 6 * 3600,
+        max_size: int = 5000,
+        persist=False,
+        batch_size: int = 50,
+        flush_interval: float = 5.0,
+    ):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.persist = persist
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._entries: OrderedDict[int, tuple[float, PlayerSession]] = OrderedDict()
+        self._loaded = not persist
+        # Pending writes by fid, None for a delete
+        self._changes: dict[int, tuple[float, PlayerSession] | None] = {}
+        self._last_flush = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hit_ratio,
+        }
+
+    def load(self):
+        """Reads the fresh persisted entries, done on first use if not before."""
+        self._loaded = True
+        rows = (
+            StoveInfo.select()
+            .where(StoveInfo.fetched_at >= time.time() - self.ttl)
+            .order_by(StoveInfo.fetched_at.desc())
+            .limit(self.max_size)
+        )
+        # Oldest first, so the most recent end up at the LRU's fresh end
+        for row in reversed(list(rows)):
+            session = PlayerSession(
+                row.fid, json.loads(row.stove_info), json.loads(row.cookies)
+            )
+            self._entries[row.fid] = (row.fetched_at, session)
+
+    def get(self, fid: int) -> PlayerSession | None:
+        if not self._loaded:
+            self.load()
+        entry = self._entries.get(fid)
+        if entry is None or time.time() - entry[0] > self.ttl:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(fid)
+        self.hits += 1
+        fetched_at, session = entry
+        # Callers update cookies on their copy, keep the cached one intact
+        return PlayerSession(session.fid, session.stove_info, dict(session.cookies))
+
+    def _store(self, fid: int, entry: tuple[float, PlayerSession]):
+        self._entries[fid] = entry
+        self._entries.move_to_end(fid)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _changed(self, fid: int, entry: tuple[float, PlayerSession] | None):
+        if not self.persist:
+            return
+        self._changes[fid] = entry
+        if (
+            len(self._changes) >= self.batch_size
+            or time.monotonic() - self._last_flush >= self.flush_interval
+        ):
+            self.flush()
+
+    def put(self, session: PlayerSession):
+        if not self._loaded:
+            self.load()
+        cached = PlayerSession(session.fid, session.stove_info, dict(session.cookies))
+        entry = (time.time(), cached)
+        self._store(session.fid, entry)
+        self._changed(session.fid, entry)
+
+    def invalidate(self, fid: int):
+        self._entries.pop(fid, None)
+        self._changed(fid, None)
+
+    def flush(self):
+        self._last_flush = time.monotonic()
+        if not self._changes:
+            return
+        rows = [
+            {
+                "fid": fid,
+                "stove_info": json.dumps(entry[1].stove_info),
+                "cookies": json.dumps(entry[1].cookies),
+                "fetched_at": int(entry[0]),
+            }
+            for fid, entry in self._changes.items()
+            if entry is not None
+        ]
+        deleted = [fid for fid, entry in self._changes.items() if entry is None]
+        self._changes.clear()
+        with database.atomic():
+            for i in range(0, len(rows), 100):
+                StoveInfo.insert_many(rows[i : i + 100]).on_conflict_replace().execute()
+            for i in range(0, len(deleted), 500):
+                StoveInfo.delete().where(
+                    StoveInfo.fid.in_(deleted[i : i + 500])
+                ).execute()
+
+
+class WOSClient:
+    """
+    Asyncio client for the WOS gift code API.
+
+    All players share one pooled, keep-alive connection pool. The shared
+    session doesn't keep cookies - they're tracked per player in
+    `PlayerSession`, so concurrent redemptions don't leak into each other.
+    `api_url` can point at a stand-in server (see tools/fake_wos_api.py).
+    """
+
+    def __init__(
+        self,
+        connection_limit: int = 32,
+        total_timeout: float = 15.0,
+        connect_timeout: float = 5.0,
+        keepalive_timeout: float = 30.0,
+        stove_cache: StoveInfoCache | None = None,
+        api_url: str = wos_api_url,
+    ):
+        self.stove_cache = stove_cache
+        self.player_url = f"{api_url}/player"
+        self.captcha_url = f"{api_url}/captcha"
+        self.giftcode_url = f"{api_url}/gift_code"
+        self.connection_limit = connection_limit
+        self.timeout = aiohttp.ClientTimeout(
+            total=total_timeout, connect=connect_timeout
+        )
+        self.keepalive_timeout = keepalive_timeout
+        self._session: aiohttp.ClientSession | None = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.connection_limit,
+                    keepalive_timeout=self.keepalive_timeout,
+                ),
+                timeout=self.timeout,
+                headers=HEADERS,
+                cookie_jar=aiohttp.DummyCookieJar(),
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        if self.stove_cache is not None:
+            self.stove_cache.flush()
+
+    async def _post(self, url: str, data: dict, cookies: dict | None = None):
+        async with self._get_session().post(
+            url, data=encode_data(data), cookies=cookies
+        ) as response:
+            payload = {}
+            if response.status == 200:
+                payload = await response.json(content_type=None)
+            elif response.status < 500 and response.status != 429:
+                # Gateway errors and 429s come back as HTML, other errors may
+                # still carry the API's JSON
+                try:
+                    payload = await response.json(content_type=None)
+                except ValueError:
+                    pass
+            new_cookies = {
+                key: morsel.value for key, morsel in response.cookies.items()
+            }
+            return response.status, payload, new_cookies
+
+    def cached_player(self, player_id: int) -> PlayerSession | None:
+        if self.stove_cache is None:
+            return None
+        return self.stove_cache.get(int(player_id))
+
+    async def get_player(self, player_id: int, use_cache=True):
+        """Returns `(PlayerSession, None)` or `(None, error)`."""
+        if use_cache:
+            cached = self.cached_player(player_id)
+            if cached is not None:
+                return cached, None
+
+        data_to_encode = {
+            "fid": f"{player_id}",
+            "time": f"{int(datetime.now().timestamp())}",
+        }
+        try:
+            status, stove_info, cookies = await self._post(
+                self.player_url, data_to_encode
+            )
+        except Exception as e:
+            print(f"Error fetching stove info: {e}")
+            return None, f"PLAYER_EXCEPTION: {str(e)}"
+
+        if status >= 500:
+            return None, "SERVER_ERROR"
+        if status == 429:
+            return None, "TOO_FREQUENT"
+        if status != 200 or not isinstance(stove_info.get("data"), dict):
+            print(f"Stove info fetch failed: {status} {stove_info}")
+            return None, "PLAYER_FETCH_ERROR"
+
+        player = PlayerSession(int(player_id), stove_info, cookies)
+        if self.stove_cache is not None:
+            self.stove_cache.put(player)
+        return player, None
+
+    async def get_captcha(self, player: PlayerSession):
+        """Returns `(base64 image, None)` or `(None, error)`."""
+        data_to_encode = {
+            "fid": player.stove_info.get("data").get("fid"),
+            "time": f"{int(datetime.now().timestamp() * 1000)}",
+            "init": "0",
+        }
+        try:
+            status, captcha_data, cookies = await self._post(
+                self.captcha_url, data_to_encode, player.cookies
+            )
+        except Exception as e:
+            print(f"Error fetching captcha: {e}")
+            return None, f"CAPTCHA_EXCEPTION: {str(e)}"
+        player.cookies.update(cookies)
+
+        if status >= 500:
+            return None, "SERVER_ERROR"
+        if status == 429:
+            return None, "TOO_FREQUENT"
+        if status == 200:
+            if (
+                captcha_data.get("code") == 1
+                and captcha_data.get("msg") == "CAPTCHA GET TOO FREQUENT."
+            ):
+                return None, "CAPTCHA_TOO_FREQUENT"
+
+            if "data" in captcha_data and "img" in captcha_data["data"]:
+                if captcha_data["data"]["img"].startswith("data:image"):
+                    img_b64_data = captcha_data["data"]["img"].split(",", 1)[1]
+                else:
+                    img_b64_data = captcha_data["data"]["img"]
+                return img_b64_data, None
+
+        # The cached login may have gone stale, fetch it again next time
+        self.forget_player(player)
+        return None, "CAPTCHA_FETCH_ERROR"
+
+    async def redeem(self, player: PlayerSession, giftcode: str, captcha_code: str):
+        """Returns `(err_code, msg)`; `err_code` is -1 if the request failed."""
+        data_to_encode = {
+            "fid": f"{player.stove_info.get('data').get('fid')}",
+            "cdk": giftcode,
+            "captcha_code": captcha_code,
+            "time": f"{int(datetime.now().timestamp()*1000)}",
+        }
+        try:
+            status, response_giftcode, cookies = await self._post(
+                self.giftcode_url, data_to_encode, player.cookies
+            )
+        except Exception as e:
+            print(f"Error redeeming gift code: {e}")
+            return -1, f"REDEEM_EXCEPTION: {str(e)}"
+        player.cookies.update(cookies)
+
+        if status >= 500:
+            return -1, "SERVER_ERROR"
+        if status == 429:
+            return -1, "TOO_FREQUENT"
+        if status != 200 and not response_giftcode:
+            return -1, f"HTTP_{status}"
+
+        if response_giftcode.get("msg") == "NOT LOGIN.":
+            self.forget_player(player)
+
+        return response_giftcode.get("err_code", 0), response_giftcode.get("msg", "")
+
+    def forget_player(self, player: PlayerSession):
+        if self.stove_cache is not None:
+            self.stove_cache.invalidate(player.fid)